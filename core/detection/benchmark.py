@@ -0,0 +1,138 @@
+import json
+import os
+import random
+
+import numpy as np
+
+from core.detection.portfolio import ALGORITHMS
+from core.detection.portfolio import run_portfolio
+from generator.network import gaussian_random_partition_graph
+from generator.network import lfr_benchmark_graph
+from utils.gml import load_cache
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyresistance", "data")
+BUNDLED = (
+    os.path.join(DATA_DIR, "karate.gml"),
+    os.path.join(DATA_DIR, "dolphin.gml"),
+    os.path.normpath(os.path.join(DATA_DIR, "..", "..", "..", "data", "real", "dblp_202.gml")),
+    os.path.join(DATA_DIR, "email.gml"),
+    os.path.join(DATA_DIR, "facebook_2888.gml"),
+)
+GRAPH_DIR = os.path.normpath(os.path.join(DATA_DIR, "..", "..", "..", "data", "benchmark"))
+SIZES = (250, 500, 1000, 2000, 4000)
+# networkx takes minutes to assign lfr communities above a thousand nodes
+LFR_SIZES = (250, 500, 1000)
+
+
+def _lfr(n, try_num=10):
+    for _ in range(try_num):
+        try:
+            return lfr_benchmark_graph(n, 2.5, 1.5, 0.1, 5, max(15, n // 25))
+        except Exception:
+            continue
+
+    return None
+
+
+def _generate(kind, n):
+    if kind == "gaussian":
+        return gaussian_random_partition_graph(n // 50, 50, 1, 20, 0.9)
+
+    return _lfr(n)
+
+
+def synthetic_graphs(sizes=SIZES, lfr_sizes=LFR_SIZES, seed=0, graph_dir=GRAPH_DIR):
+    """
+    gaussian and lfr graphs of growing size built by generator.network, saved in graph_dir
+    so that later benchmarks run on the same graphs
+    :return: list of gml paths
+    """
+    paths = list()
+    os.makedirs(graph_dir, exist_ok=True)
+
+    for kind, kind_sizes in (("gaussian", sizes), ("lfr", lfr_sizes)):
+        for n in kind_sizes:
+            path = os.path.join(graph_dir, f"{kind}_{n}.gml")
+            if not os.path.exists(path):
+                random.seed(seed)
+                np.random.seed(seed)
+                graph = _generate(kind, n)
+                if graph is None:
+                    continue
+
+                graph.write_gml(path)
+            paths.append(path)
+
+    return paths
+
+
+def _graph_desc(path, source):
+    header, _ = load_cache(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    return name, {'source': source, 'nodes': header['vcount'], 'edges': header['ecount']}
+
+
+def fit_exponent(sizes, times):
+    """
+    least squares fit of time = c * size ^ exponent on log scale
+    :return: (exponent, c), None if less than two points
+    """
+    points = [(s, t) for s, t in zip(sizes, times) if s > 0 and t > 0]
+    if len(set(s for s, _ in points)) < 2:
+        return None
+
+    x, y = np.log([s for s, _ in points]), np.log([t for _, t in points])
+    exponent, intercept = np.polyfit(x, y, 1)
+
+    return float(exponent), float(np.exp(intercept))
+
+
+def run_benchmark(algorithms=ALGORITHMS, sizes=SIZES, lfr_sizes=LFR_SIZES, timeout=300, repeat=3, processes=1, seed=0, graph_dir=GRAPH_DIR):
+    """
+    time every algorithm on the bundled graphs and on synthetic graphs of growing size,
+    one process per run keeps the timings apart, processes > 1 trades precision for speed
+    :param timeout: seconds per run or dict algorithm -> seconds, see run_portfolio
+    :param repeat: runs per (algorithm, graph), the fastest one is kept
+    :return: dict ready to be saved as json
+    """
+    graphs = [(path, "bundled") for path in BUNDLED if os.path.exists(path)]
+    for path in synthetic_graphs(sizes, lfr_sizes, seed, graph_dir):
+        graphs.append((path, os.path.basename(path).split("_")[0]))
+
+    descs = dict(_graph_desc(graph, source) for graph, source in graphs)
+    jobs = [(algorithm, graph) for algorithm in algorithms for graph, _ in graphs for _ in range(repeat)]
+    records = run_portfolio(jobs, timeout=timeout, processes=processes)
+
+    results = {algorithm: dict() for algorithm in algorithms}
+    for record in records:
+        best = results[record['algorithm']].get(record['graph'])
+        if best is None or best['status'] != 'ok' or (record['status'] == 'ok' and record['time'] < best['time']):
+            results[record['algorithm']][record['graph']] = {
+                key: value for key, value in record.items() if key not in ('algorithm', 'graph', 'params')
+            }
+
+    scaling = dict()
+    for algorithm, result in results.items():
+        finished = [name for name, record in result.items() if record['status'] == 'ok']
+        fit = fit_exponent([descs[name]['edges'] for name in finished], [result[name]['time'] for name in finished])
+        scaling[algorithm] = {
+            'exponent': round(fit[0], 4) if fit else None,
+            'coefficient': float(f"{fit[1]:.4g}") if fit else None,
+            'max_edges': max((descs[name]['edges'] for name in finished), default=0),
+        }
+
+    return {'graphs': descs, 'results': results, 'scaling': scaling}
+
+
+def save(benchmark, path):
+    with open(path, "w") as f:
+        json.dump(benchmark, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    result = run_benchmark(timeout={'default': 300, 'edge_betweenness': 120, 'spinglass': 120})
+    save(result, "benchmark.json")
+
+    for name, scaling in sorted(result['scaling'].items()):
+        print(name, scaling)
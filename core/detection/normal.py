@@ -1,5 +1,8 @@
+import hashlib
 import random
+
 import louvain as lv
+import numpy as np
 from core.detection.pyresistance.pyresistance import PyResistance
 from igraph.clustering import VertexClustering
 
@@ -61,4 +64,21 @@ def fast_resistance(graph):
         for node in part:
             membership[node] = num
 
-    return VertexClustering(graph, membership=membership)
\ No newline at end of file
+    return VertexClustering(graph, membership=membership)
+
+
+def graph_fingerprint(graph):
+    """
+    structural hash of the graph, independent of edge order and of attributes
+    """
+    edges = np.array(graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    if not graph.is_directed():
+        edges.sort(axis=1)
+    edges = edges[np.lexsort((edges[:, 1], edges[:, 0]))]
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.array([graph.vcount(), graph.is_directed()], dtype=np.int64).tobytes())
+    digest.update(edges.tobytes())
+
+    return digest.hexdigest()
+
@@ -0,0 +1,160 @@
+import os
+import time
+from collections import deque
+from multiprocessing import connection
+from multiprocessing import get_context
+
+from igraph.clustering import VertexClustering
+
+from core.detection import normal
+from core.metrics.sicounter import count_resistance
+from utils.gml import load_graph
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ALGORITHMS = (
+    'louvain',
+    'fast_greedy',
+    'edge_betweenness',
+    'label_propagation',
+    'info_map',
+    'spinglass',
+    'walk_trap',
+    'leading_eigenvector',
+    'fast_resistance',
+)
+
+
+def _peak_memory():
+    """
+    peak resident memory of the current process in MB, None if not supported
+    """
+    if resource is None:
+        return None
+
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+
+def _graph_name(graph):
+    if isinstance(graph, str):
+        return os.path.splitext(os.path.basename(graph))[0]
+
+    return graph["name"] if "name" in graph.attributes() else ""
+
+
+def _detect(algorithm, graph, kwargs, conn):
+    try:
+        if isinstance(graph, str):
+            graph = load_graph(graph)
+
+        start = time.time()
+        raw_partitions = getattr(normal, algorithm)(graph, **kwargs)
+        elapsed = time.time() - start
+
+        parts = VertexClustering(graph, membership=list(raw_partitions.membership))
+        conn.send({
+            'status': 'ok',
+            'time': round(elapsed, 4),
+            'memory': _peak_memory(),
+            'communities': len(parts),
+            'modularity': parts.modularity,
+            'resistance': count_resistance(graph, parts),
+        })
+    except Exception as e:
+        conn.send({'status': 'error', 'error': repr(e)})
+    finally:
+        conn.close()
+
+
+def _job(job):
+    algorithm, graph = job[0], job[1]
+    kwargs = job[2] if len(job) > 2 else dict()
+    if algorithm not in ALGORITHMS:
+        raise Exception(f"unknown algorithm {algorithm}.")
+
+    return algorithm, graph, kwargs
+
+
+class _Running(object):
+    def __init__(self, context, index, algorithm, graph, kwargs, timeout):
+        self.index = index
+        self.record = {'algorithm': algorithm, 'graph': _graph_name(graph), 'params': kwargs}
+        self.conn, child_conn = context.Pipe(duplex=False)
+        self.process = context.Process(target=_detect, args=(algorithm, graph, kwargs, child_conn), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        self.start_time = time.time()
+        self.deadline = self.start_time + timeout
+
+    def finish(self, result):
+        self.process.join()
+        self.conn.close()
+        self.record.update(result)
+        return self.record
+
+    def kill(self):
+        self.process.kill()
+        return self.finish({'status': 'timeout', 'time': round(time.time() - self.start_time, 4)})
+
+
+def run_portfolio(jobs, timeout=600, processes=None):
+    """
+    run community detection jobs in separate processes, a job is killed when its budget runs out
+    :param jobs: list of (algorithm, graph) or (algorithm, graph, kwargs), graph is a gml path or igraph.Graph
+    :param timeout: seconds per job, or dict algorithm -> seconds with key 'default' as fallback
+    :param processes: max running jobs, cpu count if None
+    :return: list of records in the order of jobs
+    """
+    jobs = [_job(job) for job in jobs]
+    processes = processes or os.cpu_count()
+    if not isinstance(timeout, dict):
+        timeout = {'default': timeout}
+
+    context = get_context('spawn')
+    pending = deque(enumerate(jobs))
+    running, results = dict(), [None] * len(jobs)
+
+    while pending or running:
+        while pending and len(running) < processes:
+            index, (algorithm, graph, kwargs) = pending.popleft()
+            budget = timeout.get(algorithm, timeout.get('default'))
+            job = _Running(context, index, algorithm, graph, kwargs, budget)
+            running[job.conn] = job
+
+        waits = list(running) + [job.process.sentinel for job in running.values()]
+        remain = min(job.deadline for job in running.values()) - time.time()
+        connection.wait(waits, timeout=max(remain, 0))
+
+        for conn, job in list(running.items()):
+            if conn.poll():
+                try:
+                    result = conn.recv()
+                except EOFError:
+                    result = {'status': 'error', 'error': f"exit code {job.process.exitcode}"}
+                results[job.index] = job.finish(result)
+            elif not job.process.is_alive():
+                results[job.index] = job.finish({'status': 'error', 'error': f"exit code {job.process.exitcode}"})
+            elif time.time() > job.deadline:
+                results[job.index] = job.kill()
+            else:
+                continue
+
+            del running[conn]
+
+    return results
+
+
+if __name__ == '__main__':
+    data_dir = "pyresistance/data"
+    graphs = [f"{data_dir}/{name}" for name in sorted(os.listdir(data_dir))]
+    records = run_portfolio(
+        [(algorithm, graph) for graph in graphs for algorithm in ALGORITHMS],
+        timeout={'default': 300, 'edge_betweenness': 60, 'spinglass': 60},
+    )
+
+    for record in records:
+        print(record)
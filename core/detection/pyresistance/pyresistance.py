@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
+import gc
 from math import log
+
+import numpy as np
 from igraph import Graph
+
 from core.detection.pyresistance.master import logger
+from utils.gml import read_gml
+from utils.gml import relabel
 
 
 class PyResistance:
@@ -12,31 +18,14 @@ class PyResistance:
     '''
     @classmethod
     def from_gml_file(cls, path):
-        f = open(path, 'r')
-        lines = f.readlines()
-        f.close()
-        nodes = {}
-        edges = []
-        current_edge = (-1, -1, 1)
-        in_edge = 0
-        for line in lines:
-            words = line.split()
-            if not words:
-                break
-            if words[0] == 'id':
-                nodes[int(words[1])] = 1
-            elif words[0] == 'source':
-                in_edge = 1
-                current_edge = (int(words[1]), current_edge[1], current_edge[2])
-            elif words[0] == 'target' and in_edge:
-                current_edge = (current_edge[0], int(words[1]), current_edge[2])
-            elif words[0] == 'value' and in_edge:
-                current_edge = (current_edge[0], current_edge[1], int(words[1]))
-            elif words[0] == ']' and in_edge:
-                edges.append(((current_edge[0], current_edge[1]), 1))
-                current_edge = (-1, -1, 1)
-                in_edge = 0
-        nodes, edges = in_order(nodes, edges)
+        data = read_gml(path, node_attrs=())
+        edges = relabel(data['ids'], data['edges'], sort=True)
+        weights = data['weights']
+        if (weights == np.floor(weights)).all():
+            weights = weights.astype(np.int64)
+
+        nodes = list(range(len(data['ids'])))
+        edges = list(zip(map(tuple, edges.tolist()), weights.tolist()))
         logger.info("%d nodes, %d edges" % (len(nodes), len(edges)))
         return cls(nodes, edges, path)
 
@@ -86,8 +75,10 @@ class PyResistance:
 
     def apply_method(self):
         network = (self.nodes, self.edges)
-        best_partition = [[node] for node in network[0]]
-        self.actual_partition = best_partition
+        # edges of the current level as (sources, targets, weights) arrays
+        self.edge_arrays = _edge_arrays(self.edges)
+        # super node of every original node
+        self.membership = np.arange(len(self.nodes))
         best_q = -1
         i = 1
         while True:
@@ -100,6 +91,7 @@ class PyResistance:
             partition = [c for c in partition if c]
             network = self.second_phase(network, partition)
             best_q = q
+        self.actual_partition = self.make_actual_partition()
         return (self.actual_partition, best_q)
 
     '''
@@ -242,81 +234,74 @@ class PyResistance:
     '''
 
     def second_phase(self, network, partition):
-        nodes_ = [i for i in range(len(partition))]
-        # relabelling communities
-        communities_ = []
-        d = {}
-        i = 0
-        for community in self.communities:
-            if community in d:
-                communities_.append(d[community])
-            else:
-                d[community] = i
-                communities_.append(i)
-                i += 1
-
-        communities_copy = self.communities.copy()
-        self.communities = communities_
-        # building relabelled edges
-        edges_ = {}
-        for e in network[1]:
-            ci = self.communities[e[0][0]]
-            cj = self.communities[e[0][1]]
-            try:
-                edges_[(ci, cj)] += e[1]
-            except KeyError:
-                edges_[(ci, cj)] = e[1]
-        edges_ = [(k, v) for k, v in edges_.items()]
-        # recomputing k_i vector and storing edges by node
-        self.k_i = [0 for n in nodes_]
-        self.edges_of_node = {}
-        self.w = [0 for n in nodes_]
-
-        for e in edges_:
-            self.k_i[e[0][0]] += e[1]
-            self.k_i[e[0][1]] += e[1]
-            if e[0][0] == e[0][1]:
-                self.w[e[0][0]] += e[1]
-            if e[0][0] not in self.edges_of_node:
-                self.edges_of_node[e[0][0]] = [e]
-            else:
-                self.edges_of_node[e[0][0]].append(e)
-            if e[0][1] not in self.edges_of_node:
-                self.edges_of_node[e[0][1]] = [e]
-            elif e[0][0] != e[0][1]:
-                self.edges_of_node[e[0][1]].append(e)
+        # relabelling communities in order of first appearance
+        _, first, inverse = np.unique(self.communities, return_index=True, return_inverse=True)
+        labels = np.empty(len(first), dtype=np.int64)
+        labels[np.argsort(first)] = np.arange(len(first))
+        labels = labels[inverse.reshape(-1)]
+        nodes_ = [i for i in range(len(first))]
+
+        # building relabelled edges, parallel edges are summed and keep the order of first appearance
+        sources, targets, weights = self.edge_arrays
+        sources, targets = labels[sources], labels[targets]
+        # stable sort on a combined key, the same order as np.lexsort((targets, sources)) but faster
+        order = np.argsort(sources * len(nodes_) + targets, kind='stable')
+        sources, targets = sources[order], targets[order]
+        starts = np.flatnonzero(np.diff(sources) | np.diff(targets)) + 1
+        starts = np.concatenate(([0], starts))
+        weights = np.add.reduceat(weights[order], starts)
+        appearance = np.argsort(order[starts])
+        sources, targets, weights = sources[starts][appearance], targets[starts][appearance], weights[appearance]
+        self.edge_arrays = (sources, targets, weights)
 
-        # resetting actual_communities
-        actual_parition_copy = self.actual_partition.copy()
-        self.actual_partition = [[] for i in range(len(set(communities_)))]
-        n = 0
-        for j in communities_copy:
-            self.actual_partition[d[j]].extend(actual_parition_copy[n])
-            n += 1
+        # recomputing k_i vector and storing edges by node
+        loops = sources == targets
+        self.k_i = (np.bincount(sources, weights, len(nodes_)) + np.bincount(targets, weights, len(nodes_)))
+        self.k_i = self.k_i.astype(weights.dtype).tolist()
+        self.w = np.bincount(sources[loops], weights[loops], len(nodes_)).astype(weights.dtype).tolist()
+
+        # every edge is listed under its source and then its target, self-loops only once
+        ends = np.stack((sources, targets), axis=1).reshape(-1)
+        incident = np.repeat(np.arange(len(sources)), 2)
+        keep = np.ones(len(ends), dtype=bool)
+        keep[1::2] = ~loops
+        ends, incident = ends[keep], incident[keep]
+        order = np.argsort(ends, kind='stable')
+        ends, incident = ends[order], incident[order].tolist()
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(ends)) + 1, [len(ends)]))
+
+        # the tuples are acyclic, pausing gc avoids collections triggered by millions of allocations
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            edges_ = list(zip(zip(sources.tolist(), targets.tolist()), weights.tolist()))
+            incident = list(map(edges_.__getitem__, incident))
+            self.edges_of_node = {
+                node: incident[start:end]
+                for node, start, end in zip(ends[bounds[:-1]].tolist(), bounds[:-1].tolist(), bounds[1:].tolist())
+            }
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        # moving original nodes to their super nodes
+        self.membership = labels[self.membership]
 
         # resetting communities
         self.communities = [n for n in nodes_]
         return (nodes_, edges_)
 
+    '''
+        Lists the original nodes of every super node.
+    '''
+
+    def make_actual_partition(self):
+        order = np.argsort(self.membership, kind='stable')
+        bounds = np.cumsum(np.bincount(self.membership))[:-1]
+        return [part.tolist() for part in np.split(order, bounds)]
+
 
-'''
-    Rebuilds a test_graph with successive nodes' ids.
-    _nodes: a dict of int
-    _edges: a list of ((int, int), weight) pairs
-'''
-
-
-def in_order(nodes, edges):
-        # rebuild test_graph with successive identifiers
-    nodes = sorted(nodes.keys())
-    i = 0
-    nodes_ = []
-    d = {}
-    for n in nodes:
-        nodes_.append(i)
-        d[n] = i
-        i += 1
-    edges_ = []
-    for e in edges:
-        edges_.append(((d[e[0][0]], d[e[0][1]]), e[1]))
-    return (nodes_, edges_)
+def _edge_arrays(edges):
+    pairs = np.array([e[0] for e in edges], dtype=np.int64).reshape(-1, 2)
+    weights = np.array([e[1] for e in edges])
+    return pairs[:, 0], pairs[:, 1], weights
@@ -1,28 +1,258 @@
+import numpy as np
+
+from igraph import Graph
 from igraph.clustering import VertexClustering
 
 
+class GraphBase(object):
+    """
+    read only graph shared by overlay GUtils, the adjacency is kept in CSR arrays,
+    meant for runs that only learn on the graph such as the probes of SearchRunner, anything
+    reading gutil.graph (EdgeStrategy, metrics on igraph) builds a full copy of it again
+    """
+    def __init__(self, graph, membership=None, cache_rows=True):
+        """
+        :param cache_rows: keep the neighbors of every node as lists for faster reads, costs a copy per process
+        """
+        self._graph = graph
+        self.name = getattr(graph, 'name', None)
+        self.membership = membership if membership is not None else [int(i) for i in graph.vs['part']]
+
+        adjlist = graph.get_adjlist()
+        self.indptr = np.zeros(len(adjlist) + 1, dtype=np.int64)
+        np.cumsum([len(node_neighbors) for node_neighbors in adjlist], out=self.indptr[1:])
+        self.indices = np.fromiter(
+            (neighbor for node_neighbors in adjlist for neighbor in node_neighbors),
+            dtype=np.int32, count=int(self.indptr[-1])
+        )
+        self.degrees = np.diff(self.indptr).astype(np.int32)
+        self.cache_rows = cache_rows
+        self.rows = None
+
+    @classmethod
+    def from_arrays(cls, arrays, name=None, cache_rows=True):
+        """
+        base on arrays already in CSR form, such as attached shared memory, the arrays are not copied
+        :param arrays: dict with indptr, indices, degrees and membership
+        """
+        base = cls.__new__(cls)
+        base._graph = None
+        base.name = name
+        base.membership = arrays['membership']
+        base.indptr = arrays['indptr']
+        base.indices = arrays['indices']
+        base.degrees = arrays['degrees']
+        base.cache_rows = cache_rows
+        base.rows = None
+
+        return base
+
+    def arrays(self):
+        return {
+            'indptr': self.indptr,
+            'indices': self.indices,
+            'degrees': self.degrees,
+            'membership': np.asarray(self.membership, dtype=np.int32),
+        }
+
+    @property
+    def graph(self):
+        """
+        the igraph object, rebuilt from the arrays for a base made by from_arrays
+        """
+        if self._graph is None:
+            src = np.repeat(np.arange(self.vcount()), self.degrees)
+            # an undirected self loop is stored twice in the row of its node, keep one of the two
+            mask = src < self.indices
+            mask[np.flatnonzero(src == self.indices)[::2]] = True
+            self._graph = Graph(n=self.vcount(), edges=np.column_stack((src[mask], self.indices[mask])).tolist())
+            self._graph.vs['part'] = [int(i) for i in self.membership]
+            self._graph.name = self.name
+
+        return self._graph
+
+    def vcount(self):
+        return len(self.indptr) - 1
+
+    def degree(self, node):
+        return int(self.degrees[node])
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]].tolist()
+
+    def row(self, node):
+        """
+        neighbors of the node as a list shared by every overlay of the process, never to be modified
+        """
+        if not self.cache_rows:
+            return self.neighbors(node)
+        if self.rows is None:
+            self.rows = [self.neighbors(i) for i in range(self.vcount())]
+        return self.rows[node]
+
+
+class OverlayNeighbors(object):
+    """
+    neighbors of an overlay GUtil, the row of a node is copied out of the base the first time it changes
+    """
+    def __init__(self, base):
+        self.base = base
+        self.touched = dict()
+
+    def __getitem__(self, node):
+        if node in self.touched:
+            return self.touched[node]
+        return self.base.row(node)
+
+    def __len__(self):
+        return self.base.vcount()
+
+    def degree(self, node):
+        if node in self.touched:
+            return len(self.touched[node])
+        return self.base.degree(node)
+
+    def touch(self, node):
+        if node not in self.touched:
+            self.touched[node] = self.base.neighbors(node)
+        return self.touched[node]
+
+
 class GUtil(object):
     """
     proxy to manage the variables related with graph
     """
-    def __init__(self, graph, membership=None):
-        self.graph = graph
-        self.membership = membership if membership else [int(i) for i in graph.vs['part']]
-        self.parts = VertexClustering(self.graph, self.membership)
+    def __init__(self, graph, membership=None, mutable=False):
+        """
+        :param graph: igraph Graph, or a GraphBase for an overlay, the base stays untouched, inserted and
+                      deleted edges are kept by the GUtil and the igraph object is only built if asked for
+        :param mutable: keep edges in an own store updated in O(1), the igraph object is only
+                        brought up to date by materialize, for graphs rewired many times
+        """
+        self.overlay = isinstance(graph, GraphBase)
+        if self.overlay and mutable:
+            raise Exception("An overlay GUtil cannot be mutable.")
+
+        self.base = graph if self.overlay else None
+        self._graph = None if self.overlay else graph
+        self.delta = list()
+        self.mutable = mutable
+        if membership is not None:
+            self.membership = membership.tolist() if isinstance(membership, np.ndarray) else membership
+        elif self.overlay:
+            self.membership = [int(i) for i in graph.membership]
+        else:
+            self.membership = [int(i) for i in graph.vs['part']]
+        self._parts = None
 
         self.neighbors = None
         self.sorted_parts_degree = None
+        self.trackers = list()
+        self.components = None
+
+        self.edge_list = None
+        self.edge_index = None
+        self.neighbor_position = None
+        self._dirty = False
 
         self._preprocess()
 
     def _preprocess(self):
         self._set_neighbors()
+        if self.mutable:
+            self._set_edge_store()
         self._set_sorted_part_degree()
 
+    @staticmethod
+    def _edge_key(edge):
+        src, tar = edge
+        return (src, tar) if src < tar else (tar, src)
+
+    def _set_edge_store(self):
+        self.edge_list = [self._edge_key(edge) for edge in self.graph.get_edgelist()]
+        self.edge_index = dict()
+        for i, key in enumerate(self.edge_list):
+            self.edge_index.setdefault(key, list()).append(i)
+        self.neighbor_position = dict()
+        for node, node_neighbors in self.neighbors.items():
+            position = dict()
+            for i, neighbor in enumerate(node_neighbors):
+                position.setdefault(neighbor, list()).append(i)
+            self.neighbor_position[node] = position
+
+    @property
+    def graph(self):
+        """
+        the igraph object, an overlay builds it from a copy of the base and its delta on first access
+        """
+        if self._graph is None:
+            self._graph = self.base.graph.copy()
+            for edge, flag in self.delta:
+                if flag:
+                    self._graph.add_edge(*edge)
+                else:
+                    self._graph.delete_edges([edge, ])
+            self.delta = list()
+
+        return self._graph
+
+    @graph.setter
+    def graph(self, graph):
+        self._graph = graph
+
+    @property
+    def parts(self):
+        if self._parts is None:
+            self._parts = VertexClustering(self.graph, self.membership)
+        return self._parts
+
+    @parts.setter
+    def parts(self, parts):
+        self._parts = parts
+
+    def vcount(self):
+        return self.base.vcount() if self.overlay else self._graph.vcount()
+
     def has_edge(self, edge, directed=False):
+        if self.mutable:
+            return self._edge_key(edge) in self.edge_index
+        if self.overlay:
+            src, tar = edge
+            return tar in self.neighbors[src]
+
         return self.graph.get_eid(*edge, directed=directed, error=False) != -1
 
+    def ecount(self):
+        return len(self.edge_list) if self.mutable else self.graph.ecount()
+
+    def edge(self, index):
+        """
+        :return: (src, tar) of the edge with the index, uniform sampling over range(ecount())
+        """
+        return self.edge_list[index] if self.mutable else self.graph.es[index].tuple
+
+    def degree(self, node):
+        if self.overlay:
+            return self.neighbors.degree(node)
+        return len(self.neighbors[node]) if self.mutable else self.graph.degree(node)
+
+    def materialize(self):
+        """
+        bring the igraph object up to date with the edge store of a mutable GUtil
+        :return: graph
+        """
+        if self._dirty:
+            self.graph.delete_edges(range(self.graph.ecount()))
+            self.graph.add_edges(self.edge_list)
+            self._dirty = False
+
+        return self.graph
+
     def _set_neighbors(self):
+        if self.overlay:
+            self.neighbors = OverlayNeighbors(self.base)
+            return
+
         neighbors = dict()
         for node in self.graph.vs:
             node_neighbors = self.graph.neighbors(node)
@@ -35,17 +265,47 @@ class GUtil(object):
             return
 
         src, tar = edge
-        if flag:
+        if self.mutable:
+            for node, neighbor in ((src, tar), (tar, src)):
+                self._update_neighbor_slot(node, neighbor, flag)
+        elif self.overlay:
+            for node, neighbor in ((src, tar), (tar, src)):
+                if flag:
+                    self.neighbors.touch(node).append(neighbor)
+                else:
+                    self.neighbors.touch(node).remove(neighbor)
+        elif flag:
             self.neighbors[src].append(tar)
             self.neighbors[tar].append(src)
         else:
             self.neighbors[src].remove(tar)
             self.neighbors[tar].remove(src)
 
+    def _update_neighbor_slot(self, node, neighbor, flag=True):
+        """
+        positions are kept as lists since a self loop puts the node twice in its own neighbors
+        """
+        node_neighbors, position = self.neighbors[node], self.neighbor_position[node]
+        if flag:
+            position.setdefault(neighbor, list()).append(len(node_neighbors))
+            node_neighbors.append(neighbor)
+            return
+
+        slots = position[neighbor]
+        i = slots.pop()
+        if not slots:
+            del position[neighbor]
+        last_index = len(node_neighbors) - 1
+        last = node_neighbors.pop()
+        if i != last_index:
+            node_neighbors[i] = last
+            last_slots = position[last]
+            last_slots[last_slots.index(last_index)] = i
+
     def _set_sorted_part_degree(self):
-        parts_degree: list = [list() for _ in self.parts]
+        parts_degree: list = [list() for _ in range(max(self.membership) + 1)]
         for node, part_index in enumerate(self.membership):
-            parts_degree[part_index].append((node, self.graph.degree(node)))
+            parts_degree[part_index].append((node, self.degree(node)))
 
         for part_degree in parts_degree:
             part_degree.sort(key=lambda x: x[1])
@@ -54,27 +314,56 @@ class GUtil(object):
 
     def _update_sorted_part_degree(self, edge, flag=True):
         flag = 1 if flag else -1
+        src, tar = edge
+        # a self loop counts twice in the degree of its node
+        changes = ((src, 2 * flag),) if src == tar else ((src, flag), (tar, flag))
 
-        for node in edge:
+        for node, change in changes:
             part = self.sorted_parts_degree[self.membership[node]]
-            degree = self.graph.degree(node)
+            degree = self.degree(node)
 
             part.remove((node, degree))
             for i, value in enumerate(part):
                 if value[1] > degree:
-                    part.insert(i, (node, degree + flag))
+                    part.insert(i, (node, degree + change))
                     break
             else:
                 if not part:
                     i = -1
-                part.insert(i + 1, (node, degree + flag))
+                part.insert(i + 1, (node, degree + change))
 
     def _update_graph(self, edge, flag=True):
-        if flag:
+        if self.mutable:
+            self._update_edge_store(edge, flag)
+        elif self._graph is None:
+            self.delta.append((edge, flag))
+        elif flag:
             self.graph.add_edge(*edge)
         else:
             self.graph.delete_edges([edge, ])
 
+    def _update_edge_store(self, edge, flag=True):
+        """
+        slots are kept as lists like the neighbor positions, so parallel edges are stored one by one
+        """
+        key = self._edge_key(edge)
+        self._dirty = True
+        if flag:
+            self.edge_index.setdefault(key, list()).append(len(self.edge_list))
+            self.edge_list.append(key)
+            return
+
+        slots = self.edge_index[key]
+        i = slots.pop()
+        if not slots:
+            del self.edge_index[key]
+        last_index = len(self.edge_list) - 1
+        last = self.edge_list.pop()
+        if i != last_index:
+            self.edge_list[i] = last
+            last_slots = self.edge_index[last]
+            last_slots[last_slots.index(last_index)] = i
+
     def update_membership(self, membership):
         """
         update membership manual
@@ -82,10 +371,103 @@ class GUtil(object):
         :return:
         """
         self.membership = membership
-        self.parts = VertexClustering(self.graph, self.membership)
+        self._parts = None
         self._set_sorted_part_degree()
 
+    def component_count(self):
+        """
+        number of connected components, tracked incrementally from the first call on
+        :return: int
+        """
+        if self.components is None:
+            self.components = ComponentTracker(self)
+            self.trackers.append(self.components)
+
+        return self.components.count
+
     def update(self, edge, flag=True):
         self._update_sorted_part_degree(edge, flag)
         self._update_neighbors(edge, flag)
         self._update_graph(edge, flag)
+
+        for tracker in self.trackers:
+            tracker.update(edge, flag)
+
+
+class ComponentTracker(object):
+    """
+    connected components of gutil.graph, an inserted edge merges the smaller component into the larger,
+    a deleted edge starts a search from both ends which stops as soon as the smaller side is exhausted
+    """
+    def __init__(self, gutil):
+        self.gutil = gutil
+        self.label = list(gutil.materialize().components().membership)
+        self.members = [set() for _ in range(max(self.label) + 1 if self.label else 0)]
+        for node, label in enumerate(self.label):
+            self.members[label].add(node)
+
+        self.free = list()
+        self.count = len(self.members)
+
+    def _merge(self, src, tar):
+        a, b = self.label[src], self.label[tar]
+        if a == b:
+            return
+
+        if len(self.members[a]) < len(self.members[b]):
+            a, b = b, a
+        for node in self.members[b]:
+            self.label[node] = a
+        self.members[a] |= self.members[b]
+        self.members[b] = set()
+        self.free.append(b)
+        self.count -= 1
+
+    def _separated(self, src, tar):
+        """
+        :return: node set of the side cut off by the deleted edge (src, tar), None if still connected
+        """
+        neighbors = self.gutil.neighbors
+        seen = ({src}, {tar})
+        frontiers = ([src], [tar])
+
+        while True:
+            for side in (0, 1):
+                if not frontiers[side]:
+                    return seen[side]
+
+                node = frontiers[side].pop()
+                for neighbor in neighbors[node]:
+                    if neighbor in seen[1 - side]:
+                        return None
+                    if neighbor not in seen[side]:
+                        seen[side].add(neighbor)
+                        frontiers[side].append(neighbor)
+
+    def _split(self, src, tar):
+        if src == tar:
+            # a self loop never connects two nodes
+            return
+
+        side = self._separated(src, tar)
+        if side is None:
+            return
+
+        old = self.label[src]
+        if self.free:
+            new = self.free.pop()
+        else:
+            new = len(self.members)
+            self.members.append(set())
+
+        self.members[old] -= side
+        self.members[new] = side
+        for node in side:
+            self.label[node] = new
+        self.count += 1
+
+    def update(self, edge, flag=True):
+        if flag:
+            self._merge(*edge)
+        else:
+            self._split(*edge)
@@ -83,7 +83,7 @@ class SocialLearning(object):
         return [utility, utility]
 
     def _round(self, rounds=0):
-        if not rounds: rounds = self.gutil.graph.vcount() // 2
+        if not rounds: rounds = self.gutil.vcount() // 2
 
         payoff = list()
         for _ in range(rounds):
@@ -95,7 +95,7 @@ class SocialLearning(object):
         src, tar = None, None
 
         while True:
-            src = random.randint(0, self.gutil.graph.vcount() - 1)
+            src = random.randint(0, self.gutil.vcount() - 1)
             if not self.gutil.neighbors[src]: continue
 
             tar = random.choice(self.gutil.neighbors[src])
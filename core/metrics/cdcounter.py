@@ -1,39 +1,66 @@
 import math
-from collections import Counter
 
+import numpy as np
 
-def _count_community_conformity(actions, available_action):
-    part_size = len(actions)
-    cls_actions = Counter(actions)
-    result = 0
 
-    for freq in cls_actions.values():
-        val = freq / part_size
-        result -= val * math.log2(val)
+def contingency(membership, actions, action_num=None):
+    """
+    table[c][a] is the number of nodes of community c taking action a
+    :return: np.ndarray of shape (communities, actions)
+    """
+    membership = np.asarray(membership, dtype=np.int64)
+    actions = np.asarray(actions, dtype=np.int64)
+    if action_num is None:
+        action_num = int(actions.max()) + 1 if len(actions) else 1
+    community_num = int(membership.max()) + 1 if len(membership) else 0
 
-    return 1 - 1 / math.log2(available_action) * result
+    table = np.bincount(membership * action_num + actions, minlength=community_num * action_num)
+    return table.reshape(community_num, action_num)
 
 
-def count_conformity(parts, actions, available_action):
-    result = 0
+def _entropy(freq, total):
+    """
+    entropy in bits along the last axis of the counts freq summing to total
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = freq / total
+        return -np.where(freq > 0, p * np.log2(p), 0).sum(axis=-1)
 
-    for part in parts:
-        part_actions = [actions[i] for i in part]
-        part_conformity = _count_community_conformity(part_actions, available_action)
-        result += len(part) / parts.graph.vcount() * part_conformity
 
-    return result
+def conformity_from_table(table, available_action):
+    sizes = table.sum(axis=1)
+    exist = sizes > 0
+    entropy = _entropy(table[exist], sizes[exist, None])
 
+    return float(np.sum(sizes[exist] / sizes.sum() * (1 - 1 / math.log2(available_action) * entropy)))
 
-def count_diversity(parts, actions, available_action):
+
+def diversity_from_table(table, available_action):
     if available_action == 1:
         return 0
 
-    result = 0
-    cls_actions = Counter(actions)
+    counts = table.sum(axis=0)
+    return float(1 / math.log2(available_action) * _entropy(counts, counts.sum()))
+
+
+class ActionTable(object):
+    """
+    community x action contingency table of the learners' current actions over a fixed membership,
+    built with one bincount when it is read
+    """
+    def __init__(self, learning, membership):
+        self.learning = learning
+        self.membership = np.asarray(membership, dtype=np.int64)
 
-    for freq in cls_actions.values():
-        val = freq / parts.graph.vcount()
-        result -= val * math.log2(val)
+    @property
+    def table(self):
+        actions = [learner.action for learner in self.learning.learners]
+        return contingency(self.membership, actions, self.learning.available_action)
 
-    return 1 / math.log2(available_action) * result
+
+def count_conformity(parts, actions, available_action):
+    return conformity_from_table(contingency(parts.membership, actions), available_action)
+
+
+def count_diversity(parts, actions, available_action):
+    return diversity_from_table(contingency(parts.membership, actions), available_action)
@@ -0,0 +1,98 @@
+class ModularityTracker(object):
+    """
+    modularity of the clustering given by the learners' actions, edge events of GUtil.update are
+    applied as they come, actions are read lazily and only the nodes whose action changed since
+    the last read are moved
+    """
+    def __init__(self, gutil, learning):
+        self.gutil = gutil
+        self.learning = learning
+        self.membership = [learner.action for learner in learning.learners]
+        self.degree = gutil.graph.degree()
+        self.m = gutil.graph.ecount()
+
+        size = max(self.membership) + 1 if self.membership else 0
+        self.inner = [0] * size
+        self.volume = [0] * size
+        for src, tar in gutil.graph.get_edgelist():
+            if self.membership[src] == self.membership[tar]:
+                self.inner[self.membership[src]] += 1
+        for node, cluster in enumerate(self.membership):
+            self.volume[cluster] += self.degree[node]
+
+        self.inner_sum = sum(self.inner)
+        self.volume_square_sum = sum(v * v for v in self.volume)
+
+    @classmethod
+    def attach(cls, gutil, learning):
+        """
+        track the edges of gutil and the actions of learning
+        :return: ModularityTracker
+        """
+        tracker = cls(gutil, learning)
+        gutil.trackers.append(tracker)
+
+        return tracker
+
+    def _grow(self, cluster):
+        if cluster >= len(self.inner):
+            self.inner.extend([0] * (cluster + 1 - len(self.inner)))
+            self.volume.extend([0] * (cluster + 1 - len(self.volume)))
+
+    def _add_volume(self, cluster, value):
+        volume = self.volume[cluster]
+        self.volume_square_sum += (volume + value) ** 2 - volume * volume
+        self.volume[cluster] = volume + value
+
+    def update(self, edge, flag=True):
+        """
+        called by GUtil.update after the edge is added (flag) or removed
+        """
+        value = 1 if flag else -1
+        src, tar = edge
+
+        self.m += value
+        self.degree[src] += value
+        self.degree[tar] += value
+        self._add_volume(self.membership[src], value)
+        self._add_volume(self.membership[tar], value)
+        if self.membership[src] == self.membership[tar]:
+            self.inner[self.membership[src]] += value
+            self.inner_sum += value
+
+    def _move(self, node, action):
+        old = self.membership[node]
+        self._grow(action)
+        old_links, new_links = 0, 0
+        for neighbor in self.gutil.neighbors[node]:
+            if neighbor == node:
+                continue
+            cluster = self.membership[neighbor]
+            if cluster == old:
+                old_links += 1
+            elif cluster == action:
+                new_links += 1
+
+        self.inner[old] -= old_links
+        self.inner[action] += new_links
+        self.inner_sum += new_links - old_links
+        self._add_volume(old, -self.degree[node])
+        self._add_volume(action, self.degree[node])
+        self.membership[node] = action
+
+    def sync(self):
+        """
+        move the nodes whose learner changed action since the last sync
+        """
+        actions = [learner.action for learner in self.learning.learners]
+        changed = [node for node, (old, action) in enumerate(zip(self.membership, actions)) if old != action]
+        for node in changed:
+            self._move(node, actions[node])
+
+    @property
+    def modularity(self):
+        self.sync()
+        if not self.m:
+            return float("nan")
+
+        return self.inner_sum / self.m - self.volume_square_sum / (4 * self.m * self.m)
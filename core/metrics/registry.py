@@ -0,0 +1,168 @@
+from igraph.clustering import VertexClustering
+
+from core.metrics.cdcounter import conformity_from_table
+from core.metrics.cdcounter import contingency
+from core.metrics.cdcounter import diversity_from_table
+from core.metrics.sicounter import count_security_index
+from core.metrics.sicounter import count_security_index_modified_version3
+from utils.convert import data_format
+
+
+def _actions(step):
+    return [learner.action for learner in step.runner.learning.learners]
+
+
+def _table(step):
+    table = getattr(step.runner, 'action_table', None)
+    if table is None:
+        return contingency(step.get('parts').membership, step.get('actions'), step.runner.available_action)
+
+    return table.table
+
+
+def _action_counts(step):
+    return [int(count) for count in step.get('table').sum(axis=0) if count]
+
+
+def _parts(step):
+    """
+    communities of the original graph, runners without initial_membership use the current parts
+    """
+    runner = step.runner
+    membership = getattr(runner, 'initial_membership', None)
+    if membership is None:
+        return runner.gutil.parts
+
+    return VertexClustering(runner.graph, membership=membership)
+
+
+def _graph(step):
+    """
+    the runner graph with all edge updates applied
+    """
+    gutil = getattr(step.runner, 'gutil', None)
+
+    return gutil.materialize() if gutil else step.runner.graph
+
+
+def _clu_actions(step):
+    return VertexClustering(step.get('graph'), membership=step.get('actions'))
+
+
+INTERMEDIATES = {
+    'graph': _graph,
+    'actions': _actions,
+    'parts': _parts,
+    'table': _table,
+    'action_counts': _action_counts,
+    'clu_actions': _clu_actions,
+}
+
+
+def _action_dis(step):
+    vcount = step.runner.graph.vcount()
+    dis_actions = [round(i / vcount * 100, 2) for i in step.get('action_counts')]
+    dis_actions.sort(reverse=True)
+
+    return dis_actions
+
+
+def _modularity(step):
+    tracker = getattr(step.runner, 'modularity_tracker', None)
+    if tracker is None:
+        return step.get('clu_actions').modularity
+
+    return tracker.modularity
+
+
+METRICS = {
+    'exist_action': lambda step: data_format(len(step.get('action_counts')), width=4),
+    'ldiversity': lambda step: data_format(diversity_from_table(step.get('table'), len(step.get('action_counts')))),
+    'gdiversity': lambda step: data_format(diversity_from_table(step.get('table'), step.runner.available_action)),
+    'lconformity': lambda step: data_format(conformity_from_table(step.get('table'), step.runner.available_action)),
+    'security_index': lambda step: data_format(count_security_index(step.get('graph'), step.get('clu_actions'))),
+    'security_index_v3': lambda step: data_format(
+        count_security_index_modified_version3(step.get('graph'), step.get('clu_actions'))
+    ),
+    'zero': lambda step: data_format(0),
+    'avg_payoff': lambda step: data_format(sum(step.runner.learning.payoff) / len(step.runner.learning.payoff)),
+    'components': lambda step: data_format(step.runner.gutil.component_count()),
+    'modularity': lambda step: data_format(_modularity(step)),
+    'action_dis': _action_dis,
+}
+
+
+def desc_spec(**metrics):
+    """
+    the record keys of _desc in output order with the metric computing each,
+    keyword arguments replace entries, add new ones before modularity, or drop them when None
+    :return: list of (key, metric)
+    """
+    spec = [
+        ('exist_action', 'exist_action'),
+        ('ldiversity', 'ldiversity'),
+        ('gdiversity', 'gdiversity'),
+        ('lconformity', 'lconformity'),
+        ('gconformity', 'security_index'),
+        ('avg_payoff', 'avg_payoff'),
+        ('modularity', 'modularity'),
+        ('action_dis', 'action_dis'),
+    ]
+    for key, metric in metrics.items():
+        keys = [k for k, _ in spec]
+        if metric is None:
+            spec.pop(keys.index(key))
+        elif key in keys:
+            spec[keys.index(key)] = (key, metric)
+        else:
+            spec.insert(keys.index('modularity'), (key, metric))
+
+    return spec
+
+
+class Step(object):
+    """
+    one _desc call, intermediates are computed on first use and shared by the metrics
+    """
+    def __init__(self, runner):
+        self.runner = runner
+        self._values = dict()
+
+    def get(self, name):
+        if name not in self._values:
+            self._values[name] = INTERMEDIATES[name](self)
+
+        return self._values[name]
+
+
+class MetricSet(object):
+    def __init__(self, spec, selected=None):
+        """
+        :param spec: list of (key, metric) from desc_spec
+        :param selected: keys to record, None for all, or dict key -> record every n _desc calls
+        """
+        keys = [key for key, _ in spec]
+        if selected is None:
+            selected = dict.fromkeys(keys, 1)
+        elif not isinstance(selected, dict):
+            selected = dict.fromkeys(selected, 1)
+
+        for key in selected:
+            if key not in keys:
+                raise Exception(f"unknown metric {key}.")
+
+        self.spec = [(key, METRICS[metric], selected[key]) for key, metric in spec if key in selected]
+        self.count = 0
+
+    def collect(self, runner, i):
+        step = Step(runner)
+        result = dict()
+        result['index'] = data_format(i, width=6)
+
+        for key, metric, every in self.spec:
+            if not self.count % every:
+                result[key] = metric(step)
+
+        self.count += 1
+
+        return result
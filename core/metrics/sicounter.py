@@ -33,6 +33,10 @@ def _count_resistance(graph, parts):
     return resistance
 
 
+def count_resistance(graph, parts):
+    return _count_resistance(graph, parts)
+
+
 def count_security_index(graph, parts):
     position_entropy = _count_position_entropy(graph)
     resistance = _count_resistance(graph, parts)
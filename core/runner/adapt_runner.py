@@ -1,7 +1,10 @@
 import json
+import os
 import sys
+import threading
 import time
-from collections import Counter
+
+import numpy as np
 
 from igraph import Graph
 from igraph.clustering import VertexClustering
@@ -9,19 +12,25 @@ from loguru import logger
 
 from core.gutil import GUtil
 from core.learning.social_learning import SocialLearning
-from core.metrics.cdcounter import count_conformity
-from core.metrics.cdcounter import count_diversity
-from core.metrics.sicounter import count_security_index
-from core.metrics.sicounter import count_security_index_modified_version3
+from core.metrics.cdcounter import ActionTable
+from core.metrics.modularity import ModularityTracker
+from core.metrics.registry import MetricSet
+from core.metrics.registry import desc_spec
 from core.strategy.edge import EdgeStrategy
 from utils.convert import args_join_with_sep
-from utils.convert import data_format
 from utils.convert import line_contain_word
 from utils.convert import seconds2datetime
+from utils.snapshot import learner_arrays
+from utils.snapshot import load_arrays
+from utils.snapshot import random_arrays
+from utils.snapshot import remove_arrays
+from utils.snapshot import save_arrays
+from utils.snapshot import set_random
+from utils.snapshot import to_learners
 
 
 class AdaptRunner(object):
-    def __init__(self, graph, init_iter_num, iter_num, available_action, edge_sum, mode, one_time_edge_num, edges=None, init_with_membership=False):
+    def __init__(self, graph, init_iter_num, iter_num, available_action, edge_sum, mode, one_time_edge_num, edges=None, init_with_membership=False, metrics=None, checkpoint_dir=None, checkpoint_interval=1, checkpoint_tag=None):
         self.graph: Graph = graph
         self.init_iter_num = init_iter_num
         self.iter_num: int = iter_num
@@ -29,6 +38,8 @@ class AdaptRunner(object):
         self.gutil: GUtil = GUtil(graph)
         self.initial_membership = self.gutil.membership.copy()
         self.learning: SocialLearning = SocialLearning(self.gutil, available_action, init_with_membership=init_with_membership)
+        self.modularity_tracker = ModularityTracker.attach(self.gutil, self.learning)
+        self.action_table = ActionTable(self.learning, self.initial_membership)
         self.strategy: EdgeStrategy = EdgeStrategy(self.gutil)
 
         self.edge_sum = edge_sum
@@ -36,9 +47,21 @@ class AdaptRunner(object):
         self.one_time_edge_num = one_time_edge_num
         self.edges = edges
         self.flag = "sig"
+        self.emerged = False
+        self.added_edges = list()
+        # _desc records of the run, kept in the checkpoint so a resumed run hands on all of them
+        self.records = list()
+
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_tag = checkpoint_tag
+        self._writer = None
 
         self.start_time = time.time()
         self.log_handlers = list()
+        self.recorder = None
+        self.sink = None
+        self.metrics = MetricSet(desc_spec(gconformity='security_index_v3'), metrics)
 
         self._preprocess()
 
@@ -48,11 +71,13 @@ class AdaptRunner(object):
 
     def _check(self):
         assert not self.edge_sum % self.one_time_edge_num
+        if self.checkpoint_dir and self.checkpoint_tag is None:
+            raise Exception("A checkpoint_dir needs a checkpoint_tag telling the run apart, such as its repeat and seed.")
         if not self.edges:
             self.flag = "all"
 
-    def _set_log(self):
-        log_path = args_join_with_sep(
+    def _log_path(self):
+        return args_join_with_sep(
             "logs/" + self.graph.name,
             self.available_action,
             self.iter_num,
@@ -62,6 +87,9 @@ class AdaptRunner(object):
             self.mode,
             "ADAPTIVE"
         )
+
+    def _set_log(self):
+        log_path = self._log_path()
         self.log_handlers.append(logger.add(f"{log_path}.log", rotation="30MB", format="{message}"))
         self.log_handlers.append(logger.add(sys.stderr, format="{message}"))
 
@@ -93,27 +121,124 @@ class AdaptRunner(object):
             )
         ) == 1
 
-    def _run(self):
+    def emerge(self):
+        """
+        initial emergence, done once so that branches forked afterwards start from the same state
+        """
+        if not self.emerged:
+            self.learning.emerge(self.init_iter_num)
+            self.emerged = True
+
+    def branch(self, **params):
+        """
+        continue with other edge params, meant for a forked copy of an emerged runner
+        :param params: any of iter_num, edge_sum, mode, one_time_edge_num, edges
+        """
+        for key, value in params.items():
+            if key not in ('iter_num', 'edge_sum', 'mode', 'one_time_edge_num', 'edges'):
+                raise Exception(f"{key} cannot change in a branch.")
+            setattr(self, key, value)
+
+        for i in self.log_handlers:
+            logger.remove(i)
+        self.log_handlers = list()
+        self.flag = "sig"
+        self.start_time = time.time()
+        self._preprocess()
+
+    def _checkpoint_path(self):
+        return os.path.join(self.checkpoint_dir, f"{os.path.basename(self._log_path())}_{self.checkpoint_tag}.ckpt")
+
+    def _checkpoint(self, i):
+        """
+        state after step i, copied here and written by a background thread, one write at a time
+        """
+        if not self.checkpoint_dir or (i // self.one_time_edge_num) % self.checkpoint_interval:
+            return
+
+        arrays = learner_arrays(self.learning.learners, self.learning.payoff)
+        arrays.update(random_arrays())
+        arrays['edges'] = np.array(self.added_edges, dtype=np.int32).reshape(-1, 2)
+        arrays['membership'] = np.array(self.gutil.membership, dtype=np.int32)
+        arrays['step'] = np.array([i, self.metrics.count], dtype=np.int64)
+        arrays['records'] = np.frombuffer(json.dumps(self.records).encode(), dtype=np.uint8)
+
+        self._wait_checkpoint()
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self._writer = threading.Thread(target=save_arrays, args=(arrays, self._checkpoint_path()))
+        self._writer.start()
+
+    def _wait_checkpoint(self):
+        if self._writer:
+            self._writer.join()
+            self._writer = None
+
+    def _restore(self):
+        """
+        replay the added edges on the fresh graph and load learners, parts and random of the checkpoint,
+        the records before the checkpoint go to the recorder again
+        :return: step of the checkpoint, None if there is none
+        """
+        if not self.checkpoint_dir or not os.path.exists(self._checkpoint_path()):
+            return None
+
+        arrays = load_arrays(self._checkpoint_path(), mmap=False)
+        edges = [tuple(edge) for edge in arrays['edges'].tolist()]
+        if edges:
+            self.strategy.add_edge(len(edges), self.mode, edges)
+        self.added_edges = edges
+
+        state = to_learners(arrays)
+        self.learning.learners = state['learners']
+        self.learning.payoff = state['payoff']
+
+        self.strategy.update_parts(VertexClustering(self.graph, membership=arrays['membership'].tolist()))
+        self.metrics.count = int(arrays['step'][1])
+        self.emerged = True
+        set_random(arrays)
+
+        if 'records' in arrays:
+            self.records = [(step, record) for step, record in json.loads(arrays['records'].tobytes().decode())]
+        if self.recorder:
+            for step, record in self.records:
+                self.recorder.add(step, record)
+
+        return int(arrays['step'][0])
+
+    def _run(self, resume=False):
         logger.info(line_contain_word("RECORD", char="-"))
 
-        self.learning.emerge(self.init_iter_num)
-        self._desc(0)
-        self._update()
+        step = self._restore() if resume else None
+        if step is None:
+            self.emerge()
+            self._desc(0)
+            self._update()
+            self._checkpoint(0)
+            step = 0
+        else:
+            logger.info(f"resume after {step} edges")
 
-        for i in range(self.one_time_edge_num, self.edge_sum + self.one_time_edge_num, self.one_time_edge_num):
+        for i in range(step + self.one_time_edge_num, self.edge_sum + self.one_time_edge_num, self.one_time_edge_num):
             if self._has_global_norm():
                 self._desc(i)
+                self._checkpoint(i)
                 continue
 
             if self.edges:
-                self.strategy.add_edge(self.one_time_edge_num, self.mode, self.edges[i - self.one_time_edge_num: i])
+                edges = self.strategy.add_edge(self.one_time_edge_num, self.mode, self.edges[i - self.one_time_edge_num: i])
             else:
-                self.strategy.add_edge(self.one_time_edge_num, self.mode)
+                edges = self.strategy.add_edge(self.one_time_edge_num, self.mode)
+            self.added_edges.extend(edges)
 
             self.learning.emerge(self.iter_num)
             self._desc(i)
             self._update()
+            self._checkpoint(i)
 
+        self._wait_checkpoint()
+        if self.checkpoint_dir:
+            # finished, a later run with the same tag starts over
+            remove_arrays(self._checkpoint_path())
         logger.info(line_contain_word("RECORD", char="-"))
 
     def _update(self):
@@ -121,42 +246,33 @@ class AdaptRunner(object):
         self.strategy.update_parts(VertexClustering(self.graph, membership=membership))
 
     def _desc(self, i):
-        parts = VertexClustering(self.graph, membership=self.initial_membership)
-        learners = self.learning.learners
-        vcount = self.graph.vcount()
-
-        actions = [learner.action for learner in learners]
-        cls_actions = Counter(actions)
-        dis_actions = [round(i / vcount * 100, 2) for i in cls_actions.values()]  # action中，各类action的占比，并按倒序排列
-        dis_actions.sort(reverse=True)
-        clu_actions = VertexClustering(self.graph, membership=actions)  # 以实时action构建
-
-        l_conformity = count_conformity(parts, actions, self.available_action)
-        g_conformity = count_security_index_modified_version3(self.graph, clu_actions)
-        l_diversity = count_diversity(parts, actions, len(cls_actions))
-        g_diversity = count_diversity(parts, actions, self.available_action)
-        avg_payoff = sum(self.learning.payoff) / len(self.learning.payoff)
-        modularity = clu_actions.modularity
-
-        result = dict()
-        result['index'] = data_format(i, width=6)
-        result['exist_action'] = data_format(len(cls_actions), width=4)
-        result['ldiversity'] = data_format(l_diversity)
-        result['gdiversity'] = data_format(g_diversity)
-        result['lconformity'] = data_format(l_conformity)
-        result['gconformity'] = data_format(g_conformity)
-        result['avg_payoff'] = data_format(avg_payoff)
-        result['modularity'] = data_format(modularity)
-        result['action_dis'] = dis_actions
-
-        logger.info(json.dumps(result))
-
-    def run(self):
+        result = self.metrics.collect(self, i)
+
+        if self.sink:
+            self.sink.add(i, result)
+        else:
+            logger.info(json.dumps(result))
+        if self.recorder:
+            self.recorder.add(i, result)
+        if self.checkpoint_dir:
+            self.records.append((i, result))
+
+    def run(self, resume=False):
+        """
+        :param resume: continue from the checkpoint in checkpoint_dir if there is one
+        :return: True if the run completed, False if it stopped on an assertion
+        """
         self._start()
 
+        completed = True
         try:
-            self._run()
+            self._run(resume)
         except AssertionError:
             print("Assertion Error in running.")
+            completed = False
+        finally:
+            self._wait_checkpoint()
+
+        self._end()
 
-        self._end()
\ No newline at end of file
+        return completed
\ No newline at end of file
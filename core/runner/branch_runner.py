@@ -0,0 +1,93 @@
+import os
+import random
+import time
+from collections import deque
+from multiprocessing import connection
+from multiprocessing import get_context
+
+from loguru import logger
+
+from utils.convert import seconds2datetime
+
+
+class _Records(object):
+    def __init__(self):
+        self.records = list()
+
+    def add(self, step, record):
+        self.records.append((step, record))
+
+
+def _branch(runner, params, state, conn):
+    """
+    runs in a forked child, the emerged runner is shared copy on write with the parent,
+    random reseeds itself after a fork so the state of the parent is restored
+    """
+    try:
+        random.setstate(state)
+        runner.branch(**params)
+        runner.recorder = _Records()
+        status = 'ok' if runner.run() else 'stopped'
+        conn.send({'status': status, 'records': runner.recorder.records})
+    except Exception as e:
+        conn.send({'status': 'error', 'error': repr(e)})
+    finally:
+        conn.close()
+
+
+class BranchRunner(object):
+    def __init__(self, runner, branches, processes=None):
+        """
+        :param runner: AdaptRunner whose initial emergence is shared by every branch
+        :param branches: list of dict of params each branch changes, see AdaptRunner.branch
+        :param processes: branches running at once, cpu count if None
+        """
+        self.runner = runner
+        self.branches = branches
+        self.processes = processes or os.cpu_count()
+        self.results = list()
+
+    def run(self):
+        """
+        emerge once, then fork one child per branch, children inherit the same learners, graph
+        and random state, so branches are paired comparisons from an identical start
+        :return: list of dict with params, status and the _desc records of the branch, in branch order,
+                 status is ok, stopped for a branch that ended on an assertion, or error
+        """
+        start_time = time.time()
+        self.runner.emerge()
+
+        context = get_context("fork")
+        state = random.getstate()
+        pending = deque(enumerate(self.branches))
+        running = dict()
+        results = dict()
+
+        while pending or running:
+            while pending and len(running) < self.processes:
+                index, params = pending.popleft()
+                recv_conn, send_conn = context.Pipe(duplex=False)
+                process = context.Process(target=_branch, args=(self.runner, params, state, send_conn), daemon=True)
+                process.start()
+                send_conn.close()
+                running[recv_conn] = (index, process)
+
+            for conn in connection.wait(list(running)):
+                index, process = running.pop(conn)
+                try:
+                    result = conn.recv()
+                except EOFError:
+                    result = {'status': 'error', 'error': f"exit code {process.exitcode}"}
+                conn.close()
+                process.join()
+
+                result['params'] = self.branches[index]
+                results[index] = result
+
+        for i in self.runner.log_handlers:
+            logger.remove(i)
+
+        self.results = [results[i] for i in range(len(self.branches))]
+        logger.info(f"{len(self.branches)} branches in {seconds2datetime(time.time() - start_time)}")
+
+        return self.results
@@ -1,7 +1,6 @@
 import json
 import sys
 import time
-from collections import Counter
 
 from igraph import Graph
 from igraph.clustering import VertexClustering
@@ -9,25 +8,27 @@ from loguru import logger
 
 from core.gutil import GUtil
 from core.learning.social_learning import SocialLearning
-from core.metrics.cdcounter import count_conformity
-from core.metrics.cdcounter import count_diversity
-from core.metrics.sicounter import count_security_index
+from core.metrics.cdcounter import ActionTable
+from core.metrics.modularity import ModularityTracker
+from core.metrics.registry import MetricSet
+from core.metrics.registry import desc_spec
 from core.strategy.edge import EdgeStrategy
 from core.detection.normal import louvain
 from core.detection.normal import fast_resistance
 from utils.convert import args_join_with_sep
-from utils.convert import data_format
 from utils.convert import line_contain_word
 from utils.convert import seconds2datetime
 
 
 class DynamicRunner(object):
-    def __init__(self, graph, iter_num, available_action, edge_sum, mode, points_num, edges=None):
+    def __init__(self, graph, iter_num, available_action, edge_sum, mode, points_num, edges=None, metrics=None):
         self.graph: Graph = graph
         self.iter_num = iter_num
         self.gutil: GUtil = GUtil(graph)
         self.initial_membership = self.gutil.membership
         self.learning: SocialLearning = SocialLearning(self.gutil, available_action)
+        self.modularity_tracker = ModularityTracker.attach(self.gutil, self.learning)
+        self.action_table = ActionTable(self.learning, self.initial_membership)
         self.strategy: EdgeStrategy = EdgeStrategy(self.gutil)
         self.available_action = available_action
         self.edge_sum = edge_sum
@@ -37,6 +38,9 @@ class DynamicRunner(object):
 
         self.start_time = time.time()
         self.log_handlers = list()
+        self.recorder = None
+        self.sink = None
+        self.metrics = MetricSet(desc_spec(), metrics)
 
         self._preprocess()
 
@@ -106,42 +110,28 @@ class DynamicRunner(object):
         self.strategy.update_parts(VertexClustering(self.graph, membership=membership))
 
     def _desc(self, i):
-        parts = VertexClustering(self.graph, membership=self.initial_membership)
-        learners = self.learning.learners
-        vcount = self.graph.vcount()
-
-        actions = [learner.action for learner in learners]
-        cls_actions = Counter(actions)
-        dis_actions = [round(i / vcount * 100, 2) for i in cls_actions.values()]
-        dis_actions.sort(reverse=True)
-        clu_actions = VertexClustering(self.graph, membership=actions)
-
-        l_conformity = count_conformity(parts, actions, self.available_action)
-        g_conformity = count_security_index(self.graph, clu_actions)
-        l_diversity = count_diversity(parts, actions, len(cls_actions))
-        g_diversity = count_diversity(parts, actions, self.available_action)
-        avg_payoff = sum(self.learning.payoff) / len(self.learning.payoff)
-        modularity = clu_actions.modularity
-
-        result = dict()
-        result['index'] = data_format(i, width=6)
-        result['exist_action'] = data_format(len(cls_actions), width=4)
-        result['ldiversity'] = data_format(l_diversity)
-        result['gdiversity'] = data_format(g_diversity)
-        result['lconformity'] = data_format(l_conformity)
-        result['gconformity'] = data_format(g_conformity)
-        result['avg_payoff'] = data_format(avg_payoff)
-        result['modularity'] = data_format(modularity)
-        result['action_dis'] = dis_actions
-
-        logger.info(json.dumps(result))
+        result = self.metrics.collect(self, i)
+
+        if self.sink:
+            self.sink.add(i, result)
+        else:
+            logger.info(json.dumps(result))
+        if self.recorder:
+            self.recorder.add(i, result)
 
     def run(self):
+        """
+        :return: True if the run completed, False if it stopped on an assertion
+        """
         self._start()
 
+        completed = True
         try:
             self._run()
         except AssertionError:
             print("Assertion Error in running.")
+            completed = False
 
         self._end()
+
+        return completed
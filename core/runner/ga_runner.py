@@ -2,20 +2,18 @@ import json
 import random
 import sys
 import time
-from collections import Counter
 from collections import defaultdict
 
 from igraph import Graph
-from igraph.clustering import VertexClustering
 from loguru import logger
 
 from core.gutil import GUtil
-from core.metrics.cdcounter import count_conformity
-from core.metrics.cdcounter import count_diversity
-from core.metrics.sicounter import count_security_index
+from core.metrics.cdcounter import ActionTable
+from core.metrics.modularity import ModularityTracker
+from core.metrics.registry import MetricSet
+from core.metrics.registry import desc_spec
 from core.strategy.edge import EdgeStrategy
 from utils.convert import args_join_with_sep
-from utils.convert import data_format
 from utils.convert import line_contain_word
 from utils.convert import seconds2datetime
 from utils.search import random_max_val_index
@@ -55,6 +53,35 @@ class Learner(object):
         values[self.action] = v
 
 
+class ActionIndex(object):
+    """
+    nodes of every action in a list with the position of each node, moving a node is O(1)
+    """
+    def __init__(self, actions, action_num):
+        self.actions = list(actions)
+        self.nodes = [list() for _ in range(action_num)]
+        self.position = [0] * len(self.actions)
+
+        for node, action in enumerate(self.actions):
+            self.position[node] = len(self.nodes[action])
+            self.nodes[action].append(node)
+
+    def update_action(self, node, action):
+        old = self.actions[node]
+        if old == action:
+            return
+
+        nodes = self.nodes[old]
+        last = nodes.pop()
+        if last != node:
+            nodes[self.position[node]] = last
+            self.position[last] = self.position[node]
+
+        self.position[node] = len(self.nodes[action])
+        self.nodes[action].append(node)
+        self.actions[node] = action
+
+
 class SocialLearning(object):
     def __init__(self, gutil, available_action, threshold, init_with_membership=False, init_learners=None, init_payoff=None, iter_limit_per_round=10000000):
         self.gutil = gutil
@@ -62,6 +89,7 @@ class SocialLearning(object):
         self.learners = init_learners
         self.payoff = init_payoff
         self.init_with_membership = init_with_membership
+        self.trackers = list()
         self.threshold = threshold
         self.punish_record = defaultdict(int)
         self.iter_limit_per_round = iter_limit_per_round
@@ -70,6 +98,8 @@ class SocialLearning(object):
 
     def _preprocess(self):
         self._init_learners()
+        self.action_index = ActionIndex([learner.action for learner in self.learners], self.available_action)
+        self.trackers.append(self.action_index)
 
     def _init_learners(self):
         if self.learners:
@@ -98,6 +128,9 @@ class SocialLearning(object):
             lj.is_row = True
 
         li.select_action();lj.select_action()
+        for tracker in self.trackers:
+            tracker.update_action(i, li.action)
+            tracker.update_action(j, lj.action)
         utility = 1 if li.action == lj.action else -1
         li.update(utility);lj.update(utility)
 
@@ -105,8 +138,8 @@ class SocialLearning(object):
 
     def _round(self):
         for _ in range(self.iter_limit_per_round):
-            choose_edge = random.randint(0, self.gutil.graph.ecount() - 1)
-            nodes = self.gutil.graph.es[choose_edge].tuple
+            choose_edge = random.randint(0, self.gutil.ecount() - 1)
+            nodes = self.gutil.edge(choose_edge)
 
             payoff = self._game(*nodes)
             if sum(payoff) > 0: continue
@@ -116,16 +149,10 @@ class SocialLearning(object):
                 self.punish_record[target] += 1
                 continue
 
-            nodes_with_same_action = list()
-
-            for node in range(self.gutil.graph.vcount()):
-                if self.learners[node].action == self.learners[target].action and node != target and not self.gutil.has_edge((node, target)):
-                    nodes_with_same_action.append(node)
+            node = self._choose_unlinked(target)
+            if node is None: continue
 
-            if not nodes_with_same_action: nodes_with_same_action = [i for i in range(self.gutil.graph.vcount()) if i != target and not self.gutil.has_edge((i, target))]
-            if not nodes_with_same_action: continue
-
-            add_edge = (random.choice(nodes_with_same_action), target)
+            add_edge = (node, target)
             self.gutil.update(nodes, False)
             self.gutil.update(add_edge, True)
 
@@ -133,6 +160,28 @@ class SocialLearning(object):
 
         return None
 
+    def _choose_unlinked(self, target):
+        """
+        uniform node not linked to target, taking the action of target if any such node exists,
+        sampled by rejection from the action index
+        """
+        linked = set(self.gutil.neighbors[target])
+        linked.add(target)
+        action = self.learners[target].action
+        same_action = self.action_index.nodes[action]
+
+        if len(same_action) > sum(1 for node in linked if self.learners[node].action == action):
+            candidates = same_action
+        elif self.gutil.vcount() > len(linked):
+            candidates = range(self.gutil.vcount())
+        else:
+            return None
+
+        while True:
+            node = random.choice(candidates)
+            if node not in linked:
+                return node
+
     def emerge(self):
         if not self._round():
             print("Error: out of limitation")
@@ -142,15 +191,17 @@ class SocialLearning(object):
 
 
 class GlobalAdviseRunner(object):
-    def __init__(self, graph, init_iter_num, iter_num, available_action, edge_sum, mode, one_time_edge_num, threshold, edges=None, init_with_membership=False):
+    def __init__(self, graph, init_iter_num, iter_num, available_action, edge_sum, mode, one_time_edge_num, threshold, edges=None, init_with_membership=False, metrics=None):
         self.graph: Graph = graph
         self.init_iter_num = init_iter_num
         self.iter_num: int = iter_num
         self.available_action = available_action
-        self.gutil: GUtil = GUtil(graph)
+        self.gutil: GUtil = GUtil(graph, mutable=True)
         self.initial_membership = self.gutil.membership.copy()
         self.threshold = threshold
         self.learning: SocialLearning = SocialLearning(self.gutil, available_action, threshold=threshold, init_with_membership=init_with_membership)
+        self.modularity_tracker = ModularityTracker.attach(self.gutil, self.learning)
+        self.action_table = ActionTable(self.learning, self.initial_membership)
 
         self.edge_sum = edge_sum
         self.mode = mode
@@ -160,6 +211,9 @@ class GlobalAdviseRunner(object):
 
         self.start_time = time.time()
         self.log_handlers = list()
+        self.recorder = None
+        self.sink = None
+        self.metrics = MetricSet(desc_spec(gconformity='zero', avg_payoff=None, components='components'), metrics)
 
         self._preprocess()
 
@@ -200,6 +254,7 @@ class GlobalAdviseRunner(object):
         )
 
     def _end(self):
+        self.gutil.materialize()
         logger.info(f"t: {seconds2datetime(time.time() - self.start_time)}")
         logger.info(line_contain_word("END"))
         logger.info("\n\n")
@@ -242,44 +297,28 @@ class GlobalAdviseRunner(object):
         membership = [learner.action for learner in self.learning.learners]
 
     def _desc(self, i):
-        parts = VertexClustering(self.graph, membership=self.initial_membership)
-        learners = self.learning.learners
-        vcount = self.graph.vcount()
-
-        actions = [learner.action for learner in learners]
-        cls_actions = Counter(actions)
-        dis_actions = [round(i / vcount * 100, 2) for i in cls_actions.values()]
-        dis_actions.sort(reverse=True)
-        clu_actions = VertexClustering(self.graph, membership=actions)
-
-        l_conformity = count_conformity(parts, actions, self.available_action)
-        # g_conformity = count_security_index(self.graph, clu_actions)
-        g_conformity = 0
-        l_diversity = count_diversity(parts, actions, len(cls_actions))
-        g_diversity = count_diversity(parts, actions, self.available_action)
-        # avg_payoff = sum(self.learning.payoff) / len(self.learning.payoff)
-        avg_payoff = len(self.graph.components())
-        modularity = clu_actions.modularity
-
-        result = dict()
-        result['index'] = data_format(i, width=6)
-        result['exist_action'] = data_format(len(cls_actions), width=4)
-        result['ldiversity'] = data_format(l_diversity)
-        result['gdiversity'] = data_format(g_diversity)
-        result['lconformity'] = data_format(l_conformity)
-        result['gconformity'] = data_format(g_conformity)
-        result['components'] = data_format(avg_payoff)
-        result['modularity'] = data_format(modularity)
-        result['action_dis'] = dis_actions
-
-        logger.info(json.dumps(result))
+        result = self.metrics.collect(self, i)
+
+        if self.sink:
+            self.sink.add(i, result)
+        else:
+            logger.info(json.dumps(result))
+        if self.recorder:
+            self.recorder.add(i, result)
 
     def run(self):
+        """
+        :return: True if the run completed, False if it stopped on an assertion
+        """
         self._start()
 
+        completed = True
         try:
             self._run()
         except AssertionError:
             print("Assertion Error in running.")
+            completed = False
 
         self._end()
+
+        return completed
@@ -1,6 +1,245 @@
+import os
+import random
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import product
+
+import numpy as np
 from loguru import logger
+from tqdm import tqdm
+
+from utils.convert import get_file_name_without_suffix
+from utils.convert import seconds2datetime
+from utils.gml import load_graph
+from utils.sink import BufferedSink
+from utils.store import ResultStore
+from utils.store import run_key
+
+_graphs = dict()
+_stores = dict()
+_sinks = list()
+
+# params of the runners which are file or directory paths shared by all runs
+PATH_PARAMS = ('plan_dir', 'learner_bank', 'checkpoint_dir', 'init_social_learning')
+
+
+def _init_worker(log_dir):
+    """
+    every worker writes its runner logs into log_dir/worker_<pid>, stderr included,
+    so runs in different processes never interleave in one file, the worker works in that
+    directory so path params are made absolute by Task beforehand
+    """
+    logger.remove()
+    worker_dir = os.path.join(log_dir, f"worker_{os.getpid()}")
+    os.makedirs(os.path.join(worker_dir, "logs"), exist_ok=True)
+    os.chdir(worker_dir)
+    sys.stderr = open("stderr.log", "a", buffering=1)
+
+
+def _load_graph(path):
+    if path not in _graphs:
+        _graphs[path] = load_graph(path)
+
+    return _graphs[path]
+
+
+def _load_store(path):
+    if path not in _stores:
+        _stores[path] = ResultStore(path)
+
+    return _stores[path]
+
+
+def _load_sink():
+    """
+    one buffered sink per worker, records.bin in the worker directory
+    """
+    if not _sinks:
+        _sinks.append(BufferedSink("records.bin"))
+
+    return _sinks[0]
+
+
+def _execute(task, store_path=None, buffered=False):
+    random.seed(task.seed)
+    np.random.seed(task.seed)
+
+    graph = _load_graph(task.path).copy()
+    graph.name = task.name
+    start_time = time.time()
+    runner = task.runner_cls(graph=graph, **task.run_params)
+    if store_path:
+        runner.recorder = _load_store(store_path).recorder(*task.key())
+    if buffered:
+        runner.sink = _load_sink()
+        runner.sink.begin(repr(task))
+    if task.run_params.get('checkpoint_dir'):
+        # a retry continues from the checkpoint the failed attempt left behind
+        completed = runner.run(resume=True)
+    else:
+        completed = runner.run()
+    # a run stopped on an assertion would stop the same way again with the same seed,
+    # so it is stored as done with its status instead of being retried
+    if store_path:
+        runner.recorder.finish("finished" if completed else "stopped")
+    if buffered:
+        runner.sink.flush()
+
+    return time.time() - start_time
+
+
+class Task(object):
+    """
+    one run of runner_cls on a copy of the graph read from path
+    """
+    def __init__(self, path, name, runner_cls, params, repeat, seed):
+        self.path = path
+        self.name = name
+        self.runner_cls = runner_cls
+        self.params = params
+        self.repeat = repeat
+        self.seed = seed
+        self.attempts = 0
+        self.run_params = {
+            key: os.path.abspath(value) if key in PATH_PARAMS and isinstance(value, str) else value
+            for key, value in params.items()
+        }
+        if 'learner_bank' in params and 'bank_index' not in params:
+            self.run_params['bank_index'] = repeat
+        if 'checkpoint_dir' in params and 'checkpoint_tag' not in params:
+            self.run_params['checkpoint_tag'] = f"{repeat}_{seed}"
+
+    def cost(self):
+        """
+        rough run time, graph file size times learning rounds
+        """
+        params = self.params
+        steps = params.get('edge_sum', 0) // max(params.get('one_time_edge_num', 1), 1)
+        rounds = params.get('init_iter_num', 0) + params.get('iter_num', 1) * max(steps, 1)
+
+        return os.path.getsize(self.path) * rounds
+
+    def key(self):
+        return self.name, self.runner_cls.__name__, self.params, self.repeat, self.seed
+
+    def __repr__(self):
+        return f"{self.runner_cls.__name__}({self.name}, {self.params}, repeat={self.repeat})"
 
 
 class MultiRunner(object):
-    def __init__(self):
-        pass
+    def __init__(self, tasks, processes=None, retry=2, log_dir="logs/workers", seed=0, store=None, buffered=False):
+        """
+        :param tasks: iterable of (graph, runner_cls, params, repeat), graph is a gml path or (path, name)
+        :param processes: worker number, cpu count if None
+        :param retry: times a failed run is submitted again
+        :param log_dir: root of the per worker log directories
+        :param seed: base seed, every run gets its own seed derived from it
+        :param store: sqlite path of a ResultStore, runs already finished in it are skipped
+        :param buffered: write records through a BufferedSink into records.bin of every worker instead of loguru
+        """
+        self.processes = processes or os.cpu_count()
+        self.retry = retry
+        self.log_dir = os.path.abspath(log_dir)
+        self.seed = seed
+        self.store = os.path.abspath(store) if store else None
+        self.buffered = buffered
+        self.tasks = [self._task(*task) for task in tasks]
+        self.skipped = list()
+
+        if self.store:
+            self._skip_done()
+
+        self.times = dict()
+        self.failed = list()
+
+    @staticmethod
+    def grid(graphs, runner_cls, params_list, repeat):
+        """
+        tasks of every graph with every params, each repeated repeat times,
+        repeat i of a runner with a learner_bank starts from state i of the bank
+        """
+        return [
+            (graph, runner_cls, params, i)
+            for graph, params, i in product(graphs, params_list, range(repeat))
+        ]
+
+    def _task(self, graph, runner_cls, params, repeat):
+        path, name = graph if isinstance(graph, tuple) else (graph, get_file_name_without_suffix(graph))
+        key = f"{self.seed}|{name}|{runner_cls.__name__}|{sorted(params.items())}|{repeat}"
+
+        return Task(os.path.abspath(path), name, runner_cls, params, repeat, zlib.crc32(key.encode()))
+
+    def _skip_done(self):
+        store = ResultStore(self.store)
+        done = store.done_keys()
+        store.close()
+
+        tasks, self.tasks = self.tasks, list()
+        for task in tasks:
+            (self.skipped if run_key(*task.key()) in done else self.tasks).append(task)
+
+    def _run_pool(self, queue, bar):
+        """
+        run the queue in one process pool, a worker that dies breaks the pool and fails every run
+        pending in it, those runs are charged an attempt and handed back to be run in a new pool
+        :return: list of tasks left to run
+        """
+        queue, left = deque(queue), list()
+
+        with ProcessPoolExecutor(self.processes, initializer=_init_worker, initargs=(self.log_dir,)) as executor:
+            running = dict()
+
+            while queue or running:
+                try:
+                    while queue:
+                        running[executor.submit(_execute, queue[0], self.store, self.buffered)] = queue[0]
+                        queue.popleft()
+                except BrokenProcessPool:
+                    left.extend(queue)
+                    queue.clear()
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    task = running.pop(future)
+                    task.attempts += 1
+
+                    try:
+                        self.times[task] = future.result()
+                    except Exception as e:
+                        logger.info(f"{task} failed on attempt {task.attempts}: {e!r}")
+                        if task.attempts <= self.retry:
+                            (left if isinstance(e, BrokenProcessPool) else queue).append(task)
+                            continue
+                        self.failed.append(task)
+
+                    bar.update(1)
+
+        return left
+
+    def run(self):
+        """
+        run all tasks, longest first
+        :return: list of tasks that still failed after retrying
+        """
+        start_time = time.time()
+        queue = sorted(self.tasks, key=lambda t: t.cost(), reverse=True)
+        bar = tqdm(total=len(queue))
+        os.makedirs(self.log_dir, exist_ok=True)
+
+        while queue:
+            queue = self._run_pool(queue, bar)
+
+        bar.close()
+        logger.info(
+            f"{len(self.tasks) - len(self.failed)}/{len(self.tasks)} runs done, {len(self.skipped)} skipped "
+            f"in {seconds2datetime(time.time() - start_time)}, logs in {self.log_dir}"
+        )
+
+        return self.failed
@@ -1,19 +1,80 @@
+import math
+import random
 import sys
 import time
 from collections import Counter
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
 
 from loguru import logger
 
 from core.gutil import GUtil
+from core.gutil import GraphBase
 from core.learning.social_learning import SocialLearning
 from core.strategy.edge import EdgeStrategy
 from utils.convert import args_join_with_sep
 from utils.convert import line_contain_word
 from utils.convert import seconds2datetime
+from utils.shared import SharedGraph
+from utils.shared import attach_graph
+
+_probe = dict()
+
+
+def _init_worker(spec, edges):
+    _probe['base'] = attach_graph(spec)
+    _probe['edges'] = edges
+    _probe['gutils'] = dict()
+
+
+def _main_action_proportion(learning, vcount):
+    actions = [learner.action for learner in learning.learners]
+
+    return max(Counter(actions).values()) / vcount * 100
+
+
+def _replica(edges_num, iter_num, available_action, seed):
+    """
+    one emergence on the graph with the first edges_num edges, overlays on the base kept by the worker
+    """
+    gutils = _probe['gutils']
+    if edges_num not in gutils:
+        gutils[edges_num] = GUtil(_probe['base'])
+        for edge in _probe['edges'][:edges_num]:
+            gutils[edges_num].update(edge)
+
+    random.seed(seed)
+    learning = SocialLearning(gutils[edges_num], available_action)
+    learning.emerge(iter_num)
+
+    return _main_action_proportion(learning, _probe['base'].vcount())
+
+
+def _wilson(successes, n, z):
+    """
+    Wilson score interval of the success rate of n trials
+    :return: (low, high)
+    """
+    rate = successes / n
+    scale = 1 + z * z / n
+    centre = (rate + z * z / (2 * n)) / scale
+    half_width = z / scale * math.sqrt(rate * (1 - rate) / n + z * z / (4 * n * n))
+
+    return centre - half_width, centre + half_width
 
 
 class SearchRunner(object):
-    def __init__(self, graph, iter_num, available_action, mode, max_edges_num, min_edges_num=0, repeat_time=50, precision=1):
+    THRESHOLD = 90
+    Z = 2.576
+
+    def __init__(self, graph, iter_num, available_action, mode, max_edges_num, min_edges_num=0, repeat_time=50, precision=1, edges=None, adaptive=False, min_repeat=5, processes=1, k=None):
+        """
+        :param adaptive: stop repeating once the confidence interval of the mean proportion is clear of THRESHOLD
+        :param min_repeat: repeats before the adaptive stop is considered
+        :param processes: workers running the repeats, above 1 the search probes k edge numbers per round
+        :param k: edge numbers probed per round of the parallel search, processes if None
+        """
         self.graph = graph
         self.iter_num = iter_num
         self.avail_action = available_action
@@ -22,6 +83,14 @@ class SearchRunner(object):
         self.min_edges_num = min_edges_num
         self.repeat_time = repeat_time
         self.precision = precision
+        self.edges = edges
+        self.adaptive = adaptive
+        self.min_repeat = min_repeat
+        self.processes = processes
+        self.k = k or processes
+        self.counts = dict()
+        self.repeats = dict()
+        self.base = None
 
         self.start_time = time.time()
 
@@ -44,25 +113,96 @@ class SearchRunner(object):
         self.log_handlers.append(logger.add(f"{log_path}.log", rotation="30MB", format="{message}"))
         self.log_handlers.append(logger.add(sys.stderr, format="{message}"))
 
+    def _edges(self):
+        """
+        edge sequence for max_edges_num, computed once, the sequence of fewer edges is its prefix
+        """
+        if self.edges is None:
+            strategy = EdgeStrategy(GUtil(self.graph.copy()))
+            self.edges = strategy.add_edge(self.max_edges_num, self.mode)
+
+        return self.edges
+
     def _count(self, edges_num):
-        graph = self.graph.copy()
-        gutil = GUtil(graph)
-        strategy = EdgeStrategy(gutil)
-        strategy.add_edge(edges_num, self.mode)
+        if edges_num in self.counts:
+            return self.counts[edges_num]
+
+        if self.base is None:
+            self.base = GraphBase(self.graph)
+        gutil = GUtil(self.base)
+        for edge in self._edges()[:edges_num]:
+            gutil.update(edge)
         result_list = list()
 
         for i in range(self.repeat_time):
             learning = SocialLearning(gutil, self.avail_action)
             learning.emerge(self.iter_num)
             result_list.append(self._count_main_action_proportion(learning))
+            if self.adaptive and self._decided(result_list):
+                break
+
+        self.counts[edges_num] = sum(result_list) / len(result_list)
+        self.repeats[edges_num] = len(result_list)
+
+        return self.counts[edges_num]
+
+    def _decided(self, result_list):
+        """
+        whether the Z confidence interval of the mean lies entirely above or below THRESHOLD and the
+        Wilson interval of the share of replicas reaching THRESHOLD lies on the same side of one half,
+        so a few identical results alone do not decide while a run of them does
+        """
+        n = len(result_list)
+        if n < max(self.min_repeat, 2):
+            return False
+
+        mean = sum(result_list) / n
+        std = math.sqrt(sum((result - mean) ** 2 for result in result_list) / (n - 1))
+        if abs(mean - SearchRunner.THRESHOLD) <= SearchRunner.Z * std / math.sqrt(n):
+            return False
 
-        return sum(result_list) / len(result_list)
+        converged = sum(1 for result in result_list if result >= SearchRunner.THRESHOLD)
+        low, high = _wilson(converged, n, SearchRunner.Z)
+
+        return low > 0.5 if mean > SearchRunner.THRESHOLD else high < 0.5
 
     def _count_main_action_proportion(self, learning):
-        actions = [learner.action for learner in learning.learners]
-        vcount = self.graph.vcount()
+        return _main_action_proportion(learning, self.graph.vcount())
+
+    def _count_parallel(self, edges_nums, executor):
+        """
+        _count of several edge numbers, all their repeats share the worker pool
+        :return: dict edges_num -> proportion
+        """
+        result_lists = dict()
+        running = dict()
+        for edges_num in edges_nums:
+            if edges_num in self.counts or edges_num in result_lists:
+                continue
+
+            result_lists[edges_num] = list()
+            for _ in range(self.repeat_time):
+                future = executor.submit(_replica, edges_num, self.iter_num, self.avail_action, random.getrandbits(32))
+                running[future] = edges_num
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                edges_num = running.pop(future)
+                if future.cancelled():
+                    continue
+
+                result_lists[edges_num].append(future.result())
+                if self.adaptive and self._decided(result_lists[edges_num]):
+                    for other, num in list(running.items()):
+                        if num == edges_num and other.cancel():
+                            running.pop(other)
 
-        return max(Counter(actions).values()) / vcount * 100
+        for edges_num, result_list in result_lists.items():
+            self.counts[edges_num] = sum(result_list) / len(result_list)
+            self.repeats[edges_num] = len(result_list)
+
+        return {edges_num: self.counts[edges_num] for edges_num in edges_nums}
 
     def _start(self):
         logger.info(line_contain_word("START"))
@@ -92,30 +232,75 @@ class SearchRunner(object):
         result, count = -1, 0
         i, j = self.min_edges_num, self.max_edges_num
 
-        if self._count(i) > 90:
+        if self._count(i) > SearchRunner.THRESHOLD:
             logger.info(f"Min: {i} edges can make the graph converge.")
 
-        elif self._count(j) < 90:
+        elif self._count(j) < SearchRunner.THRESHOLD:
             logger.info(f"Max: {j} edges cannot make the graph converge.")
 
         else:
             while i <= j:
                 mid = i + (j - i) // 2
                 proportion = self._count(mid)
-                if proportion >= 90:
+                if proportion >= SearchRunner.THRESHOLD:
                     result = mid
                     j = mid - self.precision
                 else:
                     i = mid + self.precision
 
                 count += 1
-                logger.info(f"{count}: {mid} edges, {proportion}%")
+                logger.info(f"{count}: {mid} edges, {proportion}%, {self.repeats[mid]} repeats")
             logger.info(f"Found: {result} edges can make the graph converge.")
 
         logger.info(line_contain_word("RECORD", char="-"))
         self.result = result
 
+    def _search_parallel(self):
+        """
+        k-ary search, each round probes k edge numbers splitting [i, j] into k + 1 parts,
+        the workers read the graph from shared memory instead of each unpickling a copy
+        """
+        logger.info(line_contain_word("RECORD", char="-"))
+        result, count = -1, 0
+        i, j = self.min_edges_num, self.max_edges_num
+
+        with SharedGraph(self.graph) as shared, ProcessPoolExecutor(
+            self.processes, initializer=_init_worker, initargs=(shared.spec, self._edges())
+        ) as executor:
+            bounds = self._count_parallel([i, j], executor)
+
+            if bounds[i] > SearchRunner.THRESHOLD:
+                logger.info(f"Min: {i} edges can make the graph converge.")
+
+            elif bounds[j] < SearchRunner.THRESHOLD:
+                logger.info(f"Max: {j} edges cannot make the graph converge.")
+
+            else:
+                while i <= j:
+                    mids = sorted(set(i + (j - i) * t // (self.k + 1) for t in range(1, self.k + 1)))
+                    proportions = self._count_parallel(mids, executor)
+
+                    converged = [mid for mid in mids if proportions[mid] >= SearchRunner.THRESHOLD]
+                    if converged:
+                        result = converged[0]
+                        j = result - self.precision
+                        mids = [mid for mid in mids if mid < result]
+                    if mids:
+                        i = mids[-1] + self.precision
+
+                    count += 1
+                    logger.info(f"{count}: " + ", ".join(
+                        f"{mid} edges, {proportions[mid]}%, {self.repeats[mid]} repeats" for mid in sorted(proportions)
+                    ))
+                logger.info(f"Found: {result} edges can make the graph converge.")
+
+        logger.info(line_contain_word("RECORD", char="-"))
+        self.result = result
+
     def search(self):
         self._start()
-        self._search()
+        if self.processes > 1:
+            self._search_parallel()
+        else:
+            self._search()
         self._end()
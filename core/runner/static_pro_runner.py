@@ -1,7 +1,6 @@
 import json
 import sys
 import time
-from collections import Counter
 
 from igraph import Graph
 from igraph.clustering import VertexClustering
@@ -9,20 +8,23 @@ from loguru import logger
 
 from core.gutil import GUtil
 from core.learning.social_learning import SocialLearning
-from core.metrics.cdcounter import count_conformity
-from core.metrics.cdcounter import count_diversity
-from core.metrics.sicounter import count_security_index
+from core.metrics.cdcounter import ActionTable
+from core.metrics.modularity import ModularityTracker
+from core.metrics.registry import MetricSet
+from core.metrics.registry import desc_spec
 from core.strategy.edge import EdgeStrategy
 from core.detection.normal import louvain
 from core.detection.normal import fast_resistance
+from generator.learners import load_bank
 from utils.convert import args_join_with_sep
-from utils.convert import data_format
 from utils.convert import line_contain_word
 from utils.convert import seconds2datetime
+from utils.graph import edge_plans
+from utils.snapshot import load_snapshot
 
 
 class StaticProRunner(object):
-    def __init__(self, graph, init_iter_num, iter_num, available_action, edge_sum, mode, one_time_edge_num, edges=None, init_with_membership=False, init_social_learning=None):
+    def __init__(self, graph, init_iter_num, iter_num, available_action, edge_sum, mode, one_time_edge_num, edges=None, init_with_membership=False, init_social_learning=None, metrics=None, plan_dir=None, learner_bank=None, bank_index=None):
         self.graph: Graph = graph
         self.init_iter_num = init_iter_num
         self.iter_num: int = iter_num
@@ -30,21 +32,34 @@ class StaticProRunner(object):
         self.gutil: GUtil = GUtil(graph)
         self.initial_membership = self.gutil.membership.copy()
 
+        if learner_bank:
+            if bank_index is None:
+                raise Exception("A learner bank needs the bank_index of the state to start from.")
+            init_social_learning = load_bank(learner_bank)[bank_index]
+
+        if isinstance(init_social_learning, str):
+            init_social_learning = load_snapshot(init_social_learning)
         init_learners = None if not init_social_learning else init_social_learning['learners']
         init_payoff = None if not init_social_learning else init_social_learning['payoff']
 
         self.learning: SocialLearning = SocialLearning(self.gutil, available_action, init_with_membership=init_with_membership, init_learners=init_learners, init_payoff=init_payoff)
+        self.modularity_tracker = ModularityTracker.attach(self.gutil, self.learning)
+        self.action_table = ActionTable(self.learning, self.initial_membership)
         self.strategy: EdgeStrategy = EdgeStrategy(self.gutil)
 
         self.edge_sum = edge_sum
         self.mode = mode
         self.one_time_edge_num = one_time_edge_num
         self.edges = edges
+        self.plan_dir = plan_dir
         self.flag = "sig"
         self.init_learners = init_social_learning
 
         self.start_time = time.time()
         self.log_handlers = list()
+        self.recorder = None
+        self.sink = None
+        self.metrics = MetricSet(desc_spec(), metrics)
 
         self._preprocess()
 
@@ -99,7 +114,17 @@ class StaticProRunner(object):
             )
         ) == 1
 
+    def _plan(self):
+        """
+        load the deterministic MIN_BA_RATIO edges from the plans in plan_dir, computed once per sweep
+        """
+        if self.edges or not self.edge_sum or not self.plan_dir or self.mode != EdgeStrategy.MIN_BA_RATIO:
+            return
+
+        self.edges = edge_plans(self.plan_dir).get(self.graph, self.gutil.membership, self.mode, self.edge_sum, self.one_time_edge_num)
+
     def _run(self):
+        self._plan()
         logger.info(line_contain_word("RECORD", char="-"))
 
         if not self.init_learners: self.learning.emerge(self.init_iter_num)
@@ -128,43 +153,28 @@ class StaticProRunner(object):
         self.strategy.update_parts(VertexClustering(self.graph, membership=membership))
 
     def _desc(self, i):
-        parts = VertexClustering(self.graph, membership=self.initial_membership)
-        learners = self.learning.learners
-
-        vcount = self.graph.vcount()
-
-        actions = [learner.action for learner in learners]
-        cls_actions = Counter(actions)
-        dis_actions = [round(i / vcount * 100, 2) for i in cls_actions.values()]
-        dis_actions.sort(reverse=True)
-        clu_actions = VertexClustering(self.graph, membership=actions)
-
-        l_conformity = count_conformity(parts, actions, self.available_action)
-        g_conformity = count_security_index(self.graph, clu_actions)
-        l_diversity = count_diversity(parts, actions, len(cls_actions))
-        g_diversity = count_diversity(parts, actions, self.available_action)
-        avg_payoff = sum(self.learning.payoff) / len(self.learning.payoff)
-        modularity = clu_actions.modularity
-
-        result = dict()
-        result['index'] = data_format(i, width=6)
-        result['exist_action'] = data_format(len(cls_actions), width=4)
-        result['ldiversity'] = data_format(l_diversity)
-        result['gdiversity'] = data_format(g_diversity)
-        result['lconformity'] = data_format(l_conformity)
-        result['gconformity'] = data_format(g_conformity)
-        result['avg_payoff'] = data_format(avg_payoff)
-        result['modularity'] = data_format(modularity)
-        result['action_dis'] = dis_actions
-
-        logger.info(json.dumps(result))
+        result = self.metrics.collect(self, i)
+
+        if self.sink:
+            self.sink.add(i, result)
+        else:
+            logger.info(json.dumps(result))
+        if self.recorder:
+            self.recorder.add(i, result)
 
     def run(self):
+        """
+        :return: True if the run completed, False if it stopped on an assertion
+        """
         self._start()
 
+        completed = True
         try:
             self._run()
         except AssertionError:
             print("Assertion Error in running.")
+            completed = False
+
+        self._end()
 
-        self._end()
\ No newline at end of file
+        return completed
\ No newline at end of file
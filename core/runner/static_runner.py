@@ -1,29 +1,30 @@
 import json
 import sys
 import time
-from collections import Counter
 
 from igraph import Graph
-from igraph.clustering import VertexClustering
 from loguru import logger
 
 from core.gutil import GUtil
 from core.learning.social_learning import SocialLearning
-from core.metrics.cdcounter import count_conformity
-from core.metrics.cdcounter import count_diversity
-from core.metrics.sicounter import count_security_index
+from core.metrics.cdcounter import ActionTable
+from core.metrics.modularity import ModularityTracker
+from core.metrics.registry import MetricSet
+from core.metrics.registry import desc_spec
 from core.strategy.edge import EdgeStrategy
 from utils.convert import args_join_with_sep
-from utils.convert import data_format
 from utils.convert import line_contain_word
 from utils.convert import seconds2datetime
+from utils.graph import edge_plans
 
 
 class StaticRunner(object):
-    def __init__(self, graph, iter_num, desc_interval, available_action, edge_sum, mode, edges=None, init_with_membership=False):
+    def __init__(self, graph, iter_num, desc_interval, available_action, edge_sum, mode, edges=None, init_with_membership=False, metrics=None, plan_dir=None):
         self.graph: Graph = graph
         self.gutil: GUtil = GUtil(graph)
         self.learning: SocialLearning = SocialLearning(self.gutil, available_action, init_with_membership=init_with_membership)
+        self.modularity_tracker = ModularityTracker.attach(self.gutil, self.learning)
+        self.action_table = ActionTable(self.learning, self.gutil.membership)
         self.strategy: EdgeStrategy = EdgeStrategy(self.gutil)
 
         self.iter_num = iter_num
@@ -32,9 +33,13 @@ class StaticRunner(object):
         self.desc_interval = desc_interval
         self.mode = mode
         self.edges = edges
+        self.plan_dir = plan_dir
 
         self.start_time = time.time()
         self.log_handlers = list()
+        self.recorder = None
+        self.sink = None
+        self.metrics = MetricSet(desc_spec(), metrics)
 
         self._preprocess()
 
@@ -73,7 +78,17 @@ class StaticRunner(object):
         for i in self.log_handlers:
             logger.remove(i)
 
+    def _plan(self):
+        """
+        load the deterministic MIN_BA_RATIO edges from the plans in plan_dir, computed once per sweep
+        """
+        if self.edges or not self.edge_sum or not self.plan_dir or self.mode != EdgeStrategy.MIN_BA_RATIO:
+            return
+
+        self.edges = edge_plans(self.plan_dir).get(self.graph, self.gutil.membership, self.mode, self.edge_sum, self.edge_sum)
+
     def _run(self):
+        self._plan()
         self.strategy.add_edge(self.edge_sum, self.mode, self.edges)
 
         logger.info(line_contain_word("RECORD", char="-"))
@@ -83,37 +98,21 @@ class StaticRunner(object):
         logger.info(line_contain_word("RECORD", char="-"))
 
     def _desc(self, i):
-        parts = self.gutil.parts
-        learners = self.learning.learners
-        vcount = self.graph.vcount()
-
-        actions = [learner.action for learner in learners]
-        cls_actions = Counter(actions)
-        dis_actions = [round(i / vcount * 100, 2) for i in cls_actions.values()]
-        dis_actions.sort(reverse=True)
-        clu_actions = VertexClustering(self.graph, membership=actions)
-
-        l_conformity = count_conformity(parts, actions, self.available_action)
-        g_conformity = count_security_index(self.graph, clu_actions)
-        l_diversity = count_diversity(parts, actions, len(cls_actions))
-        g_diversity = count_diversity(parts, actions, self.available_action)
-        avg_payoff = sum(self.learning.payoff) / len(self.learning.payoff)
-        modularity = clu_actions.modularity
-
-        result = dict()
-        result['index'] = data_format(i, width=6)
-        result['exist_action'] = data_format(len(cls_actions), width=4)
-        result['ldiversity'] = data_format(l_diversity)
-        result['gdiversity'] = data_format(g_diversity)
-        result['lconformity'] = data_format(l_conformity)
-        result['gconformity'] = data_format(g_conformity)
-        result['avg_payoff'] = data_format(avg_payoff)
-        result['modularity'] = data_format(modularity)
-        result['action_dis'] = dis_actions
-
-        logger.info(json.dumps(result))
+        result = self.metrics.collect(self, i)
+
+        if self.sink:
+            self.sink.add(i, result)
+        else:
+            logger.info(json.dumps(result))
+        if self.recorder:
+            self.recorder.add(i, result)
 
     def run(self):
+        """
+        :return: True, errors in the run are raised
+        """
         self._start()
         self._run()
         self._end()
+
+        return True
@@ -1,7 +1,9 @@
-from igraph import Graph
+import sys
+
 from loguru import logger
 
 from core.runner.adapt_runner import AdaptRunner
+from core.runner.multi_runner import MultiRunner
 from core.runner.static_pro_runner import StaticProRunner
 
 logger.remove(0)
@@ -12,6 +14,7 @@ iter_num = 1000
 available_action = 10
 edge_sum = 500
 one_time_edge_num = 5
+processes = None
 
 graph_names = [
     # ('gaussian', '6_50_1_20_0.9'),
@@ -22,20 +25,20 @@ graph_names = [
     # ('gaussian', '4_50_1_10_0.9'),
     # ('lfr', '200_2.5_1.5_0.2_5_30')
 ]
-for data_dir, graph_name in graph_names:
-    graph = Graph.Read_GML(f"data/{data_dir}/{graph_name}.gml")
-
-    for i in range(repeat):
-        copy_graph = graph.copy()
-        copy_graph.name = f"{graph_name}_{one_time_edge_num}"
-        runner = AdaptRunner(
-            graph=copy_graph,
-            iter_num=iter_num,
-            init_iter_num=init_iter_num,
-            available_action=available_action,
-            edge_sum=edge_sum,
-            mode=13,
-            one_time_edge_num=one_time_edge_num,
-            init_with_membership=False
-        )
-        runner.run()
+
+if __name__ == '__main__':
+    logger.add(sys.stderr, format="{message}")
+
+    graphs = [(f"data/{data_dir}/{graph_name}.gml", f"{graph_name}_{one_time_edge_num}") for data_dir, graph_name in graph_names]
+    params = dict(
+        iter_num=iter_num,
+        init_iter_num=init_iter_num,
+        available_action=available_action,
+        edge_sum=edge_sum,
+        mode=13,
+        one_time_edge_num=one_time_edge_num,
+        init_with_membership=False
+    )
+
+    runner = MultiRunner(MultiRunner.grid(graphs, AdaptRunner, [params], repeat), processes=processes, store="logs/results.sqlite")
+    runner.run()
@@ -1,16 +1,31 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
 from core.gutil import GUtil
 from core.learning.social_learning import SocialLearning
-from igraph import Graph
 import pickle
 from core.learning.social_learning import Learner
+from utils.snapshot import FIELDS
+from utils.snapshot import learner_arrays
+from utils.snapshot import load_arrays
+from utils.snapshot import save_arrays
+from utils.snapshot import save_snapshot
+from utils.snapshot import to_learners
+from utils.gml import load_graph
 
 
-def generate_learners(graph, rounds, actions, output_path=None):
+def generate_learners(graph, rounds, actions, output_path=None, snapshot=False):
     gutil = GUtil(graph)
     slearning = SocialLearning(gutil, actions, True, None)
     slearning.emerge(rounds)
 
     if not output_path: return slearning.learners
+    elif snapshot:
+        save_snapshot(slearning, output_path + f"/{graph.name}.snapshot")
+        return slearning.learners
     else:
         file_name = output_path + f"/{graph.name}.learners"
         with open(file_name, 'wb') as f:
@@ -19,9 +34,69 @@ def generate_learners(graph, rounds, actions, output_path=None):
         return slearning.learners
 
 
+def _emerge_state(graph, rounds, actions, seed, init_with_membership=True):
+    random.seed(seed)
+    slearning = SocialLearning(GUtil(graph), actions, init_with_membership, None)
+    slearning.emerge(rounds)
+
+    return learner_arrays(slearning.learners, slearning.payoff)
+
+
+def bank_path(output_path, graph, actions, rounds):
+    return os.path.join(output_path, f"{graph.name}_{actions}_{rounds}.bank")
+
+
+def generate_bank(graph, rounds, actions, num, output_path, processes=None, seed=0, init_with_membership=True):
+    """
+    emerge num independent learner states of graph in parallel and store them as one array per field,
+    the first axis of every array is the state index
+    :return: path of the bank directory
+    """
+    path = bank_path(output_path, graph, actions, rounds)
+    seeds = [seed * num + i for i in range(num)]
+
+    with ProcessPoolExecutor(processes) as executor:
+        states = list(executor.map(
+            _emerge_state, [graph] * num, [rounds] * num, [actions] * num, seeds, [init_with_membership] * num
+        ))
+
+    return save_arrays({field: np.stack([state[field] for state in states]) for field in FIELDS}, path)
+
+
+class LearnerBank(object):
+    """
+    pre-emerged learner states of generate_bank, memory mapped, served by index in the
+    init_social_learning format of StaticProRunner
+    """
+    def __init__(self, path):
+        self.path = path
+        self.arrays = load_arrays(path)
+
+    def __len__(self):
+        return len(self.arrays['actions'])
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise Exception(f"{self.path} has {len(self)} states, there is no state {index}.")
+        return to_learners({field: self.arrays[field][index] for field in FIELDS})
+
+
+_banks = dict()
+
+
+def load_bank(path):
+    """
+    the LearnerBank of path shared within the process
+    """
+    if path not in _banks:
+        _banks[path] = LearnerBank(path)
+
+    return _banks[path]
+
+
 if __name__ == '__main__':
     graph_name = "300_2.5_1.5_0.1_5_50"
-    graph = Graph.Read_GML("../data/lfr/" + graph_name + ".gml")
+    graph = load_graph("../data/lfr/" + graph_name + ".gml")
     graph.name = graph_name
 
     learners = generate_learners(graph, 10000, 5, '../data/learners')
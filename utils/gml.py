@@ -0,0 +1,501 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+from igraph import Graph
+
+from core.gutil import GraphBase
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_QUOTED = re.compile(rb'"[^"]*"')
+_EMPTY = b'""'
+
+_OTHER, _NODE, _EDGE = 0, 1, 2
+
+_PREFIX_MASKS = np.array([(1 << (8 * size)) - 1 for size in range(8)] + [(1 << 64) - 1], dtype=np.uint64)
+
+CACHE_VERSION = 1
+
+
+class _Buffer(object):
+    """
+    preallocated numpy array which doubles its capacity when full
+    """
+    def __init__(self, capacity, dtype, fill=0, shape=()):
+        self.size = 0
+        self.fill = fill
+        self.data = np.full((max(capacity, 16),) + shape, fill, dtype=dtype)
+
+    def extend(self, num):
+        """
+        reserve num rows and return the new size
+        """
+        capacity = len(self.data)
+        while capacity < self.size + num:
+            capacity *= 2
+
+        if capacity != len(self.data):
+            data = np.full((capacity,) + self.data.shape[1:], self.fill, dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+
+        self.size += num
+        return self.size
+
+    def array(self):
+        return self.data[:self.size]
+
+
+def _bracket_cut(buffer):
+    """
+    end of the last bracket of buffer outside of a quoted string, 0 if there is none
+    """
+    cut = max(buffer.rfind(b'['), buffer.rfind(b']'))
+    while cut >= 0 and buffer.count(b'"', 0, cut) % 2:
+        cut = max(buffer.rfind(b'[', 0, cut), buffer.rfind(b']', 0, cut))
+
+    return cut + 1
+
+
+def _token_chunks(path, chunk_size):
+    """
+    read the file in chunks ending with a bracket, so that key value pairs are never split
+    between two chunks, and yield each as Tokens
+    """
+    rest = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            buffer = rest + chunk
+            cut = _bracket_cut(buffer) if chunk else len(buffer)
+            if chunk and not cut:
+                rest = buffer
+                continue
+
+            # strings are never extracted, blank them so split keeps key value pairs
+            text = _QUOTED.sub(_EMPTY, buffer[:cut]).replace(b'[', b' [ ').replace(b']', b' ] ')
+            rest = buffer[cut:]
+            yield _Tokens(text)
+
+            if not chunk:
+                break
+
+
+class _Tokens(object):
+    """
+    whitespace separated tokens of a byte string, located by start and length without
+    creating python objects, compared and parsed as numbers with numpy
+    """
+    def __init__(self, text):
+        self.data = np.frombuffer(text, dtype=np.uint8)
+        space = np.ones(len(self.data) + 2, dtype=np.bool_)
+        # control bytes other than whitespace only occur in strings, which are blanked
+        space[1:-1] = self.data <= 32
+
+        change = np.flatnonzero(space[1:] != space[:-1])
+        self.starts = change[0::2]
+        self.lengths = change[1::2] - self.starts
+
+        # first 8 bytes of every token as one integer, tokens of up to 8 bytes compare on it
+        padded = np.concatenate((self.data, np.zeros(8, dtype=np.uint8)))
+        windows = np.lib.stride_tricks.as_strided(padded, shape=(len(self.data) + 1, 8), strides=(1, 1))
+        self.codes = windows[self.starts].view('<u8').ravel() & _PREFIX_MASKS[np.minimum(self.lengths, 8)]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _matrix(self, starts, lengths, width):
+        columns = np.arange(width)
+        positions = np.minimum(starts[:, None] + columns, max(len(self.data) - 1, 0))
+        matrix = self.data[positions] if len(self.data) else np.zeros(positions.shape, dtype=np.uint8)
+
+        return np.where(columns < lengths[:, None], matrix, 0).astype(np.uint8)
+
+    def equal(self, word):
+        """
+        :return: bool mask of the tokens equal to word
+        """
+        if len(word) <= 8:
+            code = np.frombuffer(word.ljust(8, b'\0'), dtype='<u8')[0]
+            return (self.codes == code) & (self.lengths == len(word))
+
+        mask = (self.lengths == len(word)) & (self.codes == np.frombuffer(word[:8], dtype='<u8')[0])
+        index = np.flatnonzero(mask)
+        if len(index):
+            row = np.frombuffer(word, dtype=np.uint8)
+            mask[index] = (self._matrix(self.starts[index], self.lengths[index], len(word)) == row).all(axis=1)
+
+        return mask
+
+    def key(self, index, word):
+        """
+        :return: bool mask over index, whether the token before each is word
+        """
+        keys = np.maximum(np.asarray(index) - 1, 0)
+        if len(word) <= 8:
+            code = np.frombuffer(word.ljust(8, b'\0'), dtype='<u8')[0]
+            return (self.codes[keys] == code) & (self.lengths[keys] == len(word)) & (np.asarray(index) > 0)
+
+        return self.equal(word)[keys] & (np.asarray(index) > 0)
+
+    def numbers(self, index, dtype=np.float64):
+        """
+        values of the tokens at index, integers are parsed digit by digit for all tokens at once,
+        anything else such as floats by numpy from bytes
+        """
+        starts, lengths = self.starts[index], self.lengths[index]
+        negative = self.data[starts] == 45 if len(index) else np.zeros(0, dtype=np.bool_)
+        positions, sizes = starts + negative, lengths - negative
+
+        values = np.zeros(len(index), dtype=np.int64)
+        integer = (sizes > 0) & (sizes < 19)
+        last = len(self.data) - 1
+        for column in range(int(sizes.max()) if len(index) else 0):
+            active = column < sizes
+            digits = self.data[np.minimum(positions + column, last)].astype(np.int64) - 48
+            integer &= ~active | ((digits >= 0) & (digits <= 9))
+            values = np.where(active, values * 10 + digits, values)
+
+        whole = np.issubdtype(dtype, np.integer)
+        result = np.where(negative, -values, values).astype(np.int64 if whole else np.float64)
+        others = np.flatnonzero(~integer)
+        if len(others):
+            raw = [self.data[start:start + length].tobytes() for start, length in zip(
+                starts[others].tolist(), lengths[others].tolist()
+            )]
+            try:
+                result[others] = np.array([int(word) for word in raw] if whole else np.array(raw).astype(np.float64))
+            except (ValueError, OverflowError):
+                raise Exception(f"Value is not a number that fits {np.dtype(dtype).name}: {raw[0][:64]!r}.")
+
+        return result.astype(dtype)
+
+
+def read_gml(path, node_attrs=('part',), chunk_size=1 << 24):
+    """
+    read a gml file in chunks into numpy arrays, blank lines and nested blocks are skipped
+    :param path: gml file path
+    :param node_attrs: numeric node attributes to collect
+    :param chunk_size: bytes read at once
+    :return: dict with ids (n,), edges (m, 2) in raw ids, weights (m,), attrs, directed, weighted
+    """
+    capacity = os.path.getsize(path) // 64
+    ids = _Buffer(capacity, np.int64)
+    edges = _Buffer(capacity, np.int64, fill=-1, shape=(2,))
+    weights = _Buffer(capacity, np.float64, fill=1)
+    attrs = {name: _Buffer(capacity, np.float64, fill=np.nan) for name in node_attrs}
+
+    depth, kind = 0, _OTHER
+    directed, weighted = False, False
+
+    for tokens in _token_chunks(path, chunk_size):
+        if not len(tokens):
+            continue
+
+        index = np.arange(len(tokens), dtype=np.int32)
+        opens, closes = tokens.equal(b'['), tokens.equal(b']')
+        brackets = opens | closes
+        levels = depth + np.cumsum(opens.view(np.int8) - closes.view(np.int8), dtype=np.int32)
+
+        # inside a bracket pair tokens alternate between key and value
+        starts = np.maximum.accumulate(np.where(brackets, index, -1))
+        values = ~brackets & ((index - starts) & 1 == 0)
+
+        # blocks opened at level 2 in this chunk, slot 0 is the block carried over from the last chunk
+        block_opens = opens & (levels == 2)
+        block_starts = np.flatnonzero(block_opens)
+        block_kinds = np.full(len(block_starts) + 1, kind, dtype=np.int8)
+        block_kinds[1:] = np.where(
+            tokens.key(block_starts, b'node'), _NODE, np.where(tokens.key(block_starts, b'edge'), _EDGE, _OTHER)
+        )
+        node_counts = np.cumsum(block_kinds == _NODE)
+        edge_counts = np.cumsum(block_kinds == _EDGE)
+        node_base, edge_base = ids.size - 1 - node_counts[0], edges.size - 1 - edge_counts[0]
+
+        node_num, edge_num = int(node_counts[-1] - node_counts[0]), int(edge_counts[-1] - edge_counts[0])
+        ids.extend(node_num)
+        edges.extend(edge_num)
+        weights.extend(edge_num)
+        for buffer in attrs.values():
+            buffer.extend(node_num)
+
+        selected = np.flatnonzero(values & (levels == 2))
+        blocks = np.cumsum(block_opens, dtype=np.int32)[selected]
+        kinds = block_kinds[blocks]
+
+        in_node = selected[kinds == _NODE]
+        node_index = node_base + node_counts[blocks[kinds == _NODE]]
+        unquoted = ~tokens.equal(_EMPTY)[in_node]
+
+        mask = tokens.key(in_node, b'id')
+        ids.data[node_index[mask]] = tokens.numbers(in_node[mask], np.int64)
+        for name, buffer in attrs.items():
+            mask = tokens.key(in_node, name.encode()) & unquoted
+            buffer.data[node_index[mask]] = tokens.numbers(in_node[mask])
+
+        in_edge = selected[kinds == _EDGE]
+        edge_index = edge_base + edge_counts[blocks[kinds == _EDGE]]
+        for column, key in enumerate((b'source', b'target')):
+            mask = tokens.key(in_edge, key)
+            edges.data[edge_index[mask], column] = tokens.numbers(in_edge[mask], np.int64)
+        mask = tokens.key(in_edge, b'value')
+        weights.data[edge_index[mask]] = tokens.numbers(in_edge[mask])
+        weighted = weighted or bool(mask.any())
+
+        top = np.flatnonzero(values & (levels == 1))
+        mask = tokens.key(top, b'directed')
+        if mask.any():
+            directed = bool(tokens.numbers(top[mask], np.int64)[-1])
+
+        depth, kind = int(levels[-1]), int(block_kinds[-1])
+
+    valid = (edges.array() >= 0).all(axis=1)
+
+    return {
+        'ids': ids.array(),
+        'edges': edges.array()[valid],
+        'weights': weights.array()[valid],
+        'attrs': {name: buffer.array() for name, buffer in attrs.items()},
+        'directed': directed,
+        'weighted': weighted,
+    }
+
+
+def relabel(ids, edges, sort=False):
+    """
+    map raw gml ids to successive indexes
+    :param ids: raw node ids
+    :param edges: edges in raw ids
+    :param sort: index by sorted ids instead of by order of appearance
+    :return: edges in indexes
+    """
+    if not len(ids):
+        if len(edges):
+            raise Exception(f"Edge references undeclared node id {edges.flat[0]}.")
+        return edges
+
+    order = np.argsort(ids, kind='stable')
+    positions = np.searchsorted(ids, edges, sorter=order)
+    positions = order[np.minimum(positions, len(ids) - 1)]
+    unknown = ids[positions] != edges
+    if unknown.any():
+        raise Exception(f"Edge references undeclared node id {edges[unknown][0]}.")
+    if sort:
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        positions = rank[positions]
+
+    return positions
+
+
+def _to_igraph(vcount, edges, directed, ids, attrs, weights=None):
+    graph = Graph(n=vcount, edges=edges.tolist(), directed=directed)
+    graph.vs['id'] = ids.astype(np.float64).tolist()
+    for name, values in attrs.items():
+        if not np.isnan(values).all():
+            graph.vs[name] = values.tolist()
+    if weights is not None:
+        graph.es['value'] = weights.tolist()
+
+    return graph
+
+
+def read_igraph(path, node_attrs=('part',), chunk_size=1 << 15):
+    """
+    load a gml file as igraph.Graph, vertices keep the order of the file like Graph.Read_GML,
+    only id, the numeric node_attrs and edge value are kept, string attributes such as label are not
+    """
+    data = read_gml(path, node_attrs, chunk_size)
+    edges = relabel(data['ids'], data['edges'])
+
+    return _to_igraph(
+        len(data['ids']), edges, data['directed'], data['ids'], data['attrs'],
+        data['weights'] if data['weighted'] else None
+    )
+
+
+def cache_dir(path):
+    """
+    directory of the binary cache of a gml file, data/real/x.gml -> data/real/.gmlcache/x
+    """
+    head, tail = os.path.split(path)
+
+    return os.path.join(head, ".gmlcache", os.path.splitext(tail)[0])
+
+
+def _file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _csr(vcount, edges, directed):
+    """
+    adjacency of the edges in CSR arrays, rows sorted like igraph get_adjlist
+    """
+    if directed:
+        src, tar = edges[:, 0], edges[:, 1]
+    else:
+        src = np.concatenate((edges[:, 0], edges[:, 1]))
+        tar = np.concatenate((edges[:, 1], edges[:, 0]))
+
+    indptr = np.zeros(vcount + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=vcount), out=indptr[1:])
+
+    return indptr, tar[np.lexsort((tar, src))].astype(np.int32)
+
+
+def build_cache(path, node_attrs=('part',), chunk_size=1 << 15):
+    """
+    parse the gml file once and write its binary cache, edges, ids, node attributes and CSR arrays
+    as .npy files plus header.json with counts and the mtime, size and sha1 of the gml
+    :return: cache directory
+    """
+    data = read_gml(path, node_attrs, chunk_size)
+    vcount = len(data['ids'])
+    edges = relabel(data['ids'], data['edges']).astype(np.int32).reshape(-1, 2)
+    indptr, indices = _csr(vcount, edges, data['directed'])
+
+    arrays = {'ids': data['ids'], 'edges': edges, 'indptr': indptr, 'indices': indices, 'degrees': np.diff(indptr).astype(np.int32)}
+    if data['weighted']:
+        arrays['weights'] = data['weights']
+    attrs = [name for name, values in data['attrs'].items() if not np.isnan(values).all()]
+    for name in attrs:
+        arrays[f"vs_{name}"] = data['attrs'][name]
+    if 'part' in attrs:
+        arrays['membership'] = data['attrs']['part'].astype(np.int32)
+
+    stat = os.stat(path)
+    header = {
+        'version': CACHE_VERSION,
+        'vcount': vcount,
+        'ecount': len(edges),
+        'directed': data['directed'],
+        'weighted': data['weighted'],
+        'attrs': attrs,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha1': _file_hash(path),
+    }
+
+    directory = cache_dir(path)
+    temp_dir = f"{directory}.{os.getpid()}.tmp"
+    os.makedirs(temp_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(temp_dir, f"{name}.npy"), array)
+    _write_header(temp_dir, header)
+
+    old_dir = f"{directory}.{os.getpid()}.old"
+    if os.path.exists(directory):
+        os.replace(directory, old_dir)
+    try:
+        os.replace(temp_dir, directory)
+    except OSError:
+        # published by another process meanwhile, which is used instead
+        shutil.rmtree(temp_dir)
+        if _read_header(path) is None:
+            raise
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+
+    return directory
+
+
+def _write_header(directory, header):
+    temp_path = os.path.join(directory, f"header.json.{os.getpid()}.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(header, f)
+    os.replace(temp_path, os.path.join(directory, "header.json"))
+
+
+def _read_header(path):
+    """
+    header of a valid cache of the gml file, None if missing or stale, a changed mtime with
+    the same content only refreshes the header
+    """
+    header_path = os.path.join(cache_dir(path), "header.json")
+    if not os.path.exists(header_path):
+        return None
+
+    with open(header_path) as f:
+        header = json.load(f)
+    stat = os.stat(path)
+    if header.get('version') != CACHE_VERSION or header['size'] != stat.st_size:
+        return None
+    if header['mtime_ns'] == stat.st_mtime_ns:
+        return header
+    if header['sha1'] != _file_hash(path):
+        return None
+
+    header['mtime_ns'] = stat.st_mtime_ns
+    _write_header(cache_dir(path), header)
+
+    return header
+
+
+def load_cache(path, mmap=True):
+    """
+    binary cache of the gml file, built the first time and whenever the gml changed
+    :param mmap: map the arrays read only instead of reading them
+    :return: (header, dict name -> np.ndarray)
+    """
+    directory = cache_dir(path)
+    while True:
+        header = _read_header(path)
+        if header is None and fcntl:
+            os.makedirs(os.path.dirname(directory), exist_ok=True)
+            with open(f"{directory}.lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                header = _read_header(path)
+                if header is None:
+                    build_cache(path)
+                    header = _read_header(path)
+        elif header is None:
+            build_cache(path)
+            header = _read_header(path)
+
+        try:
+            arrays = {
+                os.path.splitext(name)[0]: np.load(os.path.join(directory, name), mmap_mode='r' if mmap else None)
+                for name in os.listdir(directory) if name.endswith(".npy")
+            }
+        except FileNotFoundError:
+            # the cache was rebuilt while it was read
+            continue
+
+        return header, arrays
+
+
+def load_graph(path):
+    """
+    the graph of read_igraph through the binary cache, like read_igraph it keeps id, part and
+    edge value but not the string attributes Graph.Read_GML returns, such as label
+    """
+    header, arrays = load_cache(path)
+
+    return _to_igraph(
+        header['vcount'], arrays['edges'], header['directed'], arrays['ids'],
+        {name: arrays[f"vs_{name}"] for name in header['attrs']},
+        arrays['weights'] if header['weighted'] else None
+    )
+
+
+def load_base(path, cache_rows=True):
+    """
+    GraphBase on the mapped CSR arrays of the cache, for overlay GUtils without parsing or building a graph
+    """
+    header, arrays = load_cache(path)
+    if 'membership' not in arrays:
+        raise Exception(f"{path} has no part for the membership.")
+
+    return GraphBase.from_arrays(arrays, os.path.splitext(os.path.basename(path))[0], cache_rows)
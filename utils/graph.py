@@ -1,15 +1,25 @@
+import hashlib
+import os
 import pickle
 import json
 
+import numpy as np
 from igraph import Graph
 from tqdm import tqdm
 from igraph.clustering import VertexClustering
 from typing import List
 
 from core.detection.normal import fast_resistance
+from core.detection.normal import graph_fingerprint
 from core.gutil import GUtil
 from core.learning.social_learning import Learner
 from core.strategy.edge import EdgeStrategy
+from utils.gml import load_graph
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 def get_edges(graph, mode, func, edge_sum, interval=1, output_path="../data/edges"):
@@ -29,6 +39,98 @@ def get_edges(graph, mode, func, edge_sum, interval=1, output_path="../data/edge
         pickle.dump(edges, f)
 
 
+def plan_edges(graph, membership, mode, edge_sum, interval=1):
+    """
+    edges a runner with fixed membership adds, interval at a time with the parts refreshed in between
+    like StaticProRunner._update does
+    :return: list of edges
+    """
+    strategy = EdgeStrategy(GUtil(graph.copy(), list(membership)))
+    edges = list()
+
+    strategy.update_parts(VertexClustering(strategy.gutil.graph, membership=list(membership)))
+    for _ in range(edge_sum // interval):
+        edges.extend(strategy.add_edge(interval, mode))
+        strategy.update_parts(VertexClustering(strategy.gutil.graph, membership=list(membership)))
+
+    return edges
+
+
+class EdgePlans(object):
+    """
+    edge sequences of plan_edges keyed by graph fingerprint, membership, mode, budget and interval,
+    kept as int32 arrays in memory and in plan_dir, so every repeat of a sweep loads the same plan
+    """
+    def __init__(self, plan_dir=None):
+        self.plan_dir = plan_dir
+        self.plans = dict()
+
+        if self.plan_dir:
+            os.makedirs(self.plan_dir, exist_ok=True)
+
+    @staticmethod
+    def key(graph, membership, mode, edge_sum, interval=1):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(graph_fingerprint(graph).encode())
+        digest.update(np.asarray(membership, dtype=np.int64).tobytes())
+        digest.update(f"|{mode}|{edge_sum}|{interval}".encode())
+
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.plan_dir, f"{key}.npy")
+
+    def _load(self, key):
+        if key not in self.plans and self.plan_dir and os.path.exists(self._path(key)):
+            self.plans[key] = np.load(self._path(key))
+
+        return self.plans.get(key)
+
+    def _compute(self, key, graph, membership, mode, edge_sum, interval):
+        plan = np.array(plan_edges(graph, membership, mode, edge_sum, interval), dtype=np.int32).reshape(-1, 2)
+        self.plans[key] = plan
+
+        if self.plan_dir:
+            temp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                np.save(f, plan)
+            os.replace(temp_path, self._path(key))
+
+        return plan
+
+    def get(self, graph, membership, mode, edge_sum, interval=1):
+        """
+        the plan of graph, computed by the first caller while other processes wait for it
+        :return: list of (src, tar), ready to be passed to runners as edges
+        """
+        key = self.key(graph, membership, mode, edge_sum, interval)
+        plan = self._load(key)
+
+        if plan is None and self.plan_dir and fcntl:
+            with open(f"{self._path(key)}.lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                plan = self._load(key)
+                if plan is None:
+                    plan = self._compute(key, graph, membership, mode, edge_sum, interval)
+        elif plan is None:
+            plan = self._compute(key, graph, membership, mode, edge_sum, interval)
+
+        return [tuple(edge) for edge in plan.tolist()]
+
+
+_edge_plans = dict()
+
+
+def edge_plans(plan_dir=None):
+    """
+    the EdgePlans of plan_dir shared within the process
+    """
+    if plan_dir not in _edge_plans:
+        _edge_plans[plan_dir] = EdgePlans(plan_dir)
+
+    return _edge_plans[plan_dir]
+
+
 def desc(graph: Graph):
     parts = VertexClustering(graph, [int(i) for i in graph.vs['part']])
     print(graph.vcount(), graph.ecount())
@@ -62,7 +164,7 @@ def desc_learners(learners: List[Learner]):
 if __name__ == '__main__':
 
     graph_name = "4_50_1_10_0.9"
-    test_graph = Graph.Read_GML(f"../data/gaussian/{graph_name}.gml")
+    test_graph = load_graph(f"../data/gaussian/{graph_name}.gml")
     desc(test_graph)
     # test_graph.name = graph_name
     #
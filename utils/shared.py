@@ -0,0 +1,58 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from core.gutil import GraphBase
+
+_attached = dict()
+
+
+class SharedGraph(object):
+    """
+    CSR arrays, degree vector and membership of a graph placed once in shared memory blocks,
+    workers attach to them by spec without copying, the owner unlinks the blocks when done
+    """
+    def __init__(self, graph, membership=None):
+        base = graph if isinstance(graph, GraphBase) else GraphBase(graph, membership, cache_rows=False)
+
+        self.blocks = dict()
+        self.spec = {'name': base.name, 'arrays': dict()}
+        for key, array in base.arrays().items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self.blocks[key] = block
+            self.spec['arrays'][key] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def attach_graph(spec, cache_rows=True):
+    """
+    GraphBase on the shared blocks of the spec, attached once per process and kept open until it exits
+    :param cache_rows: see GraphBase, off to keep the memory of a worker flat at the cost of rebuilding rows
+    :return: GraphBase
+    """
+    key = tuple(name for name, _, _ in spec['arrays'].values())
+    if key not in _attached:
+        arrays = dict()
+        blocks = list()
+        for name, (block_name, shape, dtype) in spec['arrays'].items():
+            block = shared_memory.SharedMemory(name=block_name)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            array.flags.writeable = False
+            arrays[name] = array
+            blocks.append(block)
+
+        _attached[key] = (GraphBase.from_arrays(arrays, spec['name'], cache_rows), blocks)
+
+    return _attached[key][0]
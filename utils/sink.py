@@ -0,0 +1,128 @@
+import json
+import pickle
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+
+_HEADER = struct.Struct("<I")
+_STOP = object()
+
+
+class TerminalView(object):
+    """
+    prints at most one record every interval seconds
+    """
+    def __init__(self, interval=5.0, stream=None):
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.last_time = 0
+
+    def show(self, record):
+        now = time.time()
+        if now - self.last_time < self.interval:
+            return
+
+        self.last_time = now
+        self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
+
+
+class BufferedSink(object):
+    """
+    receives the _desc records of runners and writes them from a background thread,
+    each batch is stored column by column as one zlib compressed pickle frame
+    """
+    def __init__(self, path, batch_size=512, flush_interval=1.0, view=None, compress_level=1):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.view = view
+        self.compress_level = compress_level
+        self.label = None
+
+        self._queue = queue.Queue()
+        self._file = open(path, "ab")
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def begin(self, label):
+        """
+        tag the following records with the label of the run that writes them
+        """
+        self.label = label
+
+    def add(self, step, record):
+        self._queue.put((self.label, step, record))
+
+    def _work(self):
+        stop = False
+        while not stop:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if batch[-1] is _STOP:
+                stop = True
+            records = [item for item in batch if item is not _STOP]
+            if records:
+                self._write(records)
+                if self.view:
+                    self.view.show(records[-1][2])
+
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, records):
+        keys = list()
+        for _, _, record in records:
+            keys.extend(key for key in record if key not in keys)
+
+        columns = {
+            'run': [label for label, _, _ in records],
+            'step': [step for _, step, _ in records],
+            'records': {key: [record.get(key) for _, _, record in records] for key in keys},
+        }
+        frame = zlib.compress(pickle.dumps(columns, protocol=4), self.compress_level)
+        self._file.write(_HEADER.pack(len(frame)))
+        self._file.write(frame)
+        self._file.flush()
+
+    def flush(self):
+        """
+        block until every added record is on disk
+        """
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._file.close()
+
+
+def read_records(path):
+    """
+    yield (run, step, record) from a file written by BufferedSink
+    """
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                break
+
+            frame = f.read(_HEADER.unpack(header)[0])
+            columns = pickle.loads(zlib.decompress(frame))
+            values = columns['records']
+            for i, (run, step) in enumerate(zip(columns['run'], columns['step'])):
+                record = {key: values[key][i] for key in values}
+                yield run, step, record
@@ -0,0 +1,189 @@
+import os
+import random
+import shutil
+import time
+
+import numpy as np
+
+from core.learning.social_learning import Learner
+
+FIELDS = ('actions', 'is_row', 'rows', 'cols', 'payoff')
+
+
+def learner_arrays(learners, payoff=None, dtype=np.float64):
+    """
+    state of the learners as arrays, Q tables are (learners, actions) in dtype
+    :return: dict field -> np.ndarray
+    """
+    return {
+        'actions': np.array([learner.action for learner in learners], dtype=np.int16),
+        'is_row': np.array([learner.is_row for learner in learners], dtype=np.bool_),
+        'rows': np.array([learner._rows for learner in learners], dtype=dtype),
+        'cols': np.array([learner._cols for learner in learners], dtype=dtype),
+        'payoff': np.array(payoff or [], dtype=np.int8),
+    }
+
+
+class MappedLearner(Learner):
+    """
+    Learner whose Q tables stay in the snapshot arrays until it first uses them,
+    so a memory mapped snapshot is only read for the learners a run touches
+    """
+    def __init__(self, arrays, index, action, is_row):
+        self.is_row = is_row
+        self.action = action
+        self._action_num = arrays['rows'].shape[-1]
+        self._arrays = arrays
+        self._index = index
+
+    def __getattr__(self, name):
+        # only called while _rows and _cols are not set yet
+        if name not in ('_rows', '_cols') or '_arrays' not in self.__dict__:
+            raise AttributeError(name)
+
+        self._rows = self._arrays['rows'][self._index].tolist()
+        self._cols = self._arrays['cols'][self._index].tolist()
+        del self._arrays
+
+        return getattr(self, name)
+
+    def __getstate__(self):
+        state = dict(self.__dict__, _rows=self._rows, _cols=self._cols)
+        state.pop('_arrays', None)
+
+        return state
+
+
+def to_learners(arrays):
+    """
+    learners and payoff in the init_social_learning format of the runners, the Q tables of
+    each learner are read from the arrays when it first uses them
+    """
+    learners = [
+        MappedLearner(arrays, index, action, is_row)
+        for index, (action, is_row) in enumerate(zip(arrays['actions'].tolist(), arrays['is_row'].tolist()))
+    ]
+
+    return {'learners': learners, 'payoff': arrays['payoff'].tolist()}
+
+
+def _target(path):
+    """
+    directory of the arrays at path, behind the symlink or the pointer file save_arrays wrote
+    """
+    if os.path.isfile(path):
+        with open(path) as f:
+            return os.path.join(os.path.dirname(path), f.read().strip())
+
+    return os.path.realpath(path)
+
+
+def save_arrays(arrays, path):
+    """
+    write every array as <name>.npy into a new directory next to path, then point path at it
+    with one rename, readers find either the old or the new arrays, never none,
+    path is a symlink or, where symlinks are not available, a file holding the directory name
+    """
+    path = os.path.normpath(path)
+    version_path = f"{path}.{os.getpid()}.{time.time_ns()}"
+    os.makedirs(version_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(version_path, f"{name}.npy"), array)
+
+    link_path = f"{version_path}.link"
+    try:
+        os.symlink(os.path.basename(version_path), link_path)
+    except (OSError, NotImplementedError):
+        with open(link_path, "w") as f:
+            f.write(os.path.basename(version_path))
+
+    old_path = None
+    if os.path.islink(path) or os.path.isfile(path):
+        old_path = _target(path)
+    elif os.path.isdir(path):
+        # a directory of an older save is moved aside once, a link cannot replace it
+        old_path = f"{version_path}.old"
+        os.replace(path, old_path)
+    os.replace(link_path, path)
+
+    if old_path and os.path.isdir(old_path):
+        shutil.rmtree(old_path)
+
+    return path
+
+
+def remove_arrays(path):
+    """
+    remove arrays written by save_arrays, the symlink or pointer file and the directory it points to
+    """
+    path = os.path.normpath(path)
+    if os.path.islink(path) or os.path.isfile(path):
+        target = _target(path)
+        os.remove(path)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+
+
+def load_arrays(path, mmap=True):
+    """
+    :param mmap: map the arrays read only instead of reading them
+    :return: dict name -> np.ndarray
+    """
+    while True:
+        directory = _target(path)
+        try:
+            arrays = {
+                os.path.splitext(name)[0]: np.load(os.path.join(directory, name), mmap_mode='r' if mmap else None)
+                for name in sorted(os.listdir(directory)) if name.endswith(".npy")
+            }
+        except FileNotFoundError:
+            if _target(path) == directory:
+                raise
+            continue
+
+        # a save switching path meanwhile may have deleted files of directory before they were read
+        if _target(path) == directory:
+            return arrays
+
+
+def random_arrays():
+    """
+    state of python random as arrays
+    """
+    version, state, gauss = random.getstate()
+
+    return {
+        'random': np.array(state, dtype=np.uint32),
+        'random_gauss': np.array([np.nan if gauss is None else gauss], dtype=np.float64),
+    }
+
+
+def set_random(arrays):
+    gauss = float(arrays['random_gauss'][0])
+    random.setstate((3, tuple(arrays['random'].tolist()), None if np.isnan(gauss) else gauss))
+
+
+def save_snapshot(learning, path, dtype=np.float64, with_random=True):
+    """
+    snapshot of a SocialLearning, Q tables, actions and payoff, plus the state of python random
+    :param dtype: np.float32 halves the size, np.float64 restores the Q tables exactly
+    """
+    arrays = learner_arrays(learning.learners, learning.payoff, dtype)
+    if with_random:
+        arrays.update(random_arrays())
+
+    return save_arrays(arrays, path)
+
+
+def load_snapshot(path, mmap=True, restore_random=False):
+    """
+    :param restore_random: set python random to the state saved with the snapshot
+    :return: dict with learners and payoff in the init_social_learning format
+    """
+    arrays = load_arrays(path, mmap)
+    if restore_random and 'random' in arrays:
+        set_random(arrays)
+
+    return to_learners(arrays)
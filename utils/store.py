@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    graph TEXT NOT NULL,
+    runner TEXT NOT NULL,
+    params TEXT NOT NULL,
+    repeat INTEGER NOT NULL,
+    seed INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    status TEXT,
+    start_time REAL,
+    end_time REAL,
+    UNIQUE (graph, runner, params, repeat, seed)
+);
+CREATE TABLE IF NOT EXISTS records (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    seq INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, seq)
+);
+"""
+
+
+def run_key(graph, runner, params, repeat, seed):
+    """
+    identity of a run in the store, params are stored as sorted json
+    """
+    return graph, runner, json.dumps(params, sort_keys=True, default=str), int(repeat), int(seed)
+
+
+class Recorder(object):
+    """
+    collects the _desc records of one run, they are written together when the run finishes
+    so an interrupted run leaves nothing behind and is simply run again
+    """
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+        self.records = list()
+        self.start_time = time.time()
+
+    def add(self, step, record):
+        self.records.append((int(step), json.dumps(record)))
+
+    def finish(self, status="finished"):
+        """
+        :param status: finished, or stopped for a run that ended early on an assertion
+        """
+        self.store.save(self.key, self.records, self.start_time, status)
+
+
+class ResultStore(object):
+    """
+    sqlite store of finished runs keyed by graph, runner, params, repeat and seed,
+    safe to share between processes as long as every process opens its own ResultStore
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=600)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        if "status" not in [row[1] for row in self.conn.execute("PRAGMA table_info(runs)")]:
+            with self.conn:
+                self.conn.execute("ALTER TABLE runs ADD COLUMN status TEXT")
+                self.conn.execute("UPDATE runs SET status='finished' WHERE done=1")
+
+    def recorder(self, graph, runner, params, repeat, seed):
+        return Recorder(self, run_key(graph, runner, params, repeat, seed))
+
+    def save(self, key, records, start_time=None, status="finished"):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO runs (graph, runner, params, repeat, seed) VALUES (?, ?, ?, ?, ?)", key
+            )
+            run_id = self.conn.execute(
+                "SELECT id FROM runs WHERE graph=? AND runner=? AND params=? AND repeat=? AND seed=?", key
+            ).fetchone()[0]
+            self.conn.execute("DELETE FROM records WHERE run_id=?", (run_id,))
+            self.conn.executemany(
+                "INSERT INTO records (run_id, seq, step, data) VALUES (?, ?, ?, ?)",
+                [(run_id, seq, step, data) for seq, (step, data) in enumerate(records)]
+            )
+            self.conn.execute(
+                "UPDATE runs SET done=1, status=?, start_time=?, end_time=? WHERE id=?",
+                (status, start_time, time.time(), run_id)
+            )
+
+    def is_done(self, graph, runner, params, repeat, seed):
+        row = self.conn.execute(
+            "SELECT done FROM runs WHERE graph=? AND runner=? AND params=? AND repeat=? AND seed=?",
+            run_key(graph, runner, params, repeat, seed)
+        ).fetchone()
+
+        return bool(row and row[0])
+
+    def status(self, graph, runner, params, repeat, seed):
+        """
+        :return: finished or stopped for a done run, None otherwise
+        """
+        row = self.conn.execute(
+            "SELECT status FROM runs WHERE graph=? AND runner=? AND params=? AND repeat=? AND seed=? AND done=1",
+            run_key(graph, runner, params, repeat, seed)
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def done_keys(self):
+        return set(self.conn.execute("SELECT graph, runner, params, repeat, seed FROM runs WHERE done=1"))
+
+    def records(self, graph=None, runner=None, status=None):
+        """
+        yield (graph, runner, params, repeat, seed, step, record) of done runs
+        :param status: only runs with this status, finished or stopped, all done runs if None
+        """
+        query = (
+            "SELECT graph, runner, params, repeat, seed, step, data FROM runs JOIN records ON runs.id = records.run_id "
+            "WHERE done=1 AND (? IS NULL OR graph=?) AND (? IS NULL OR runner=?) AND (? IS NULL OR status=?) "
+            "ORDER BY runs.id, seq"
+        )
+        for row in self.conn.execute(query, (graph, graph, runner, runner, status, status)):
+            yield row[:2] + (json.loads(row[2]),) + row[3:6] + (json.loads(row[6]),)
+
+    def close(self):
+        self.conn.close()